@@ -0,0 +1,98 @@
+import queue
+import threading
+from collections import deque
+
+from translator import DCPUTranslator, TranslationError
+
+
+class Build:
+    """ Result of a background assembly """
+
+    def __init__(self, key, labels=None, program=None, dat_labels=None, errors=(), warnings=()):
+        self.key = key
+        self.labels = labels
+        self.program = program
+        self.dat_labels = dat_labels
+        self.errors = list(errors)
+        self.warnings = list(warnings)
+
+    def __repr__(self):
+        return f'<Build ok: {self.ok} errors: {len(self.errors)} warnings: {len(self.warnings)}>'
+
+    @property
+    def ok(self):
+        return self.program is not None
+
+    def diagnostics(self, filename) -> dict:
+        """ line -> (severity: 'error' or 'warning', message) for one file, errors win """
+        result = {}
+        for severity, items in (('warning', self.warnings), ('error', self.errors)):
+            for item in items:
+                if item.file == filename:
+                    result[item.line] = severity, item.message
+
+        return result
+
+
+class AssemblerThread(threading.Thread):
+    """ Assembles the project in background while the user types.
+
+    `submit` queues a build of the editor buffers, when several requests
+    pile up only the latest one is assembled. The thread has its own
+    `DCPUTranslator`, files which did not change come from its cache.
+    Finished `Build`s go to `builds`, a one slot deque the UI polls.
+    """
+
+    def __init__(self, workdir, filename):
+        super().__init__(daemon=True)
+        self.workdir = workdir
+        self.filename = filename
+        self.translator = DCPUTranslator()
+
+        self.requests = queue.SimpleQueue()
+        self.builds = deque(maxlen=1)
+
+    def submit(self, key, sources):
+        """
+        :param key: state of the buffers, comes back as `Build.key`
+        :param sources: filename -> text of files open in editors
+        """
+        self.requests.put((key, dict(sources)))
+
+    def stop(self):
+        self.requests.put(None)
+        self.join()
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+
+            # newer requests replace the pending ones
+            try:
+                while True:
+                    request = self.requests.get_nowait()
+                    if request is None:
+                        return
+            except queue.Empty:
+                pass
+
+            self.builds.append(self.build(*request))
+
+    def build(self, key, sources) -> Build:
+        self.translator.sources = sources
+
+        dat_labels = []
+        warnings = []
+        try:
+            labels, program = self.translator.translate(self.workdir, self.filename, dat_labels, warnings)
+        except TranslationError as ex:
+            return Build(key, errors=getattr(ex, 'errors', [ex]), warnings=warnings)
+        except OSError as ex:
+            return Build(key, errors=[TranslationError(self.filename, 0, str(ex))], warnings=warnings)
+        except Exception as ex:
+            # a translator bug must not stop background builds for the rest of the session
+            return Build(key, errors=[TranslationError(self.filename, 0, f'Internal error: {ex!r}')], warnings=warnings)
+
+        return Build(key, labels, program, dat_labels, warnings=warnings)
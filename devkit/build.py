@@ -0,0 +1,165 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from translator import DCPUTranslator, TranslationError, save_program
+
+
+# translator of the worker process, keeps its own cache between tasks
+_worker_translator = None
+
+
+def _encode(workdir, filename):
+    """ Process pool task: parse and encode one file.
+
+    :return: cache entry for `DCPUTranslator.import_cache` or None if the
+        file failed to translate
+    """
+    global _worker_translator
+    if _worker_translator is None:
+        _worker_translator = DCPUTranslator()
+
+    try:
+        _worker_translator.encode_file(workdir, filename)
+    except Exception:
+        # any failure, translator bugs too, is left to the serial step
+        return None
+
+    return _worker_translator.export_cache(workdir, filename)
+
+
+class ParallelBuilder:
+    """ Assembles programs using a process pool.
+
+    Source and include files are parsed and encoded concurrently, every
+    file only once even if it is shared by several programs. Label
+    resolution and linking run in the current process, so the result is
+    the same as the serial `DCPUTranslator.asm2bin`.
+
+    Files which fail in a worker are left to the serial link step, it
+    re-encodes them and reports the same error a serial build would, for
+    that program only.
+
+    Starting workers and copying encoded files back costs more than it
+    saves for small inputs, so with one usable CPU or less than
+    `MIN_POOL_LINES` source lines the files are encoded in this process.
+    """
+
+    MIN_POOL_LINES = 20000
+
+    def __init__(self, jobs=None, translator=None):
+        # more workers than usable CPUs only add overhead
+        cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+        self.jobs = min(jobs, cpus) if jobs else cpus
+        self.translator = translator or DCPUTranslator()
+
+    def source_lines(self, programs) -> int:
+        """ Lines of all files reachable from `programs` via `.include`, found by a text scan """
+        seen = set()
+        pending = list(programs)
+        lines = 0
+
+        while pending:
+            workdir, filename = pending.pop()
+            if (workdir, filename) in seen:
+                continue
+            seen.add((workdir, filename))
+
+            try:
+                text, _ = self.translator.read_source(workdir, filename, cache={})
+            except (TranslationError, OSError):
+                continue
+
+            lines += len(text)
+            for kind, item in self.translator.scan_macros(filename, text):
+                if kind == 'include':
+                    pending.append((workdir, item[0]))
+
+        return lines
+
+    def use_pool(self, programs) -> bool:
+        return self.jobs > 1 and self.source_lines(programs) >= self.MIN_POOL_LINES
+
+    def encode_all(self, programs):
+        """ Encode all files reachable from `programs` via `.include`
+
+        :param programs: list of (workdir, filename)
+        """
+        if not self.use_pool(programs):
+            # the link step encodes the files
+            return
+
+        seen = set()
+        pending = {}
+
+        with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+            def submit(workdir, filename):
+                key = (workdir, filename)
+                if key in seen:
+                    return
+                seen.add(key)
+                pending[pool.submit(_encode, workdir, filename)] = key
+
+            for workdir, filename in programs:
+                submit(workdir, filename)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    workdir, filename = pending.pop(future)
+                    try:
+                        entry = future.result()
+                    except Exception:
+                        # e.g. a crashed worker, the serial step encodes the file
+                        entry = None
+                    if entry is None:
+                        continue
+
+                    self.translator.import_cache(workdir, filename, entry)
+
+                    for fragment in entry[2][0]:
+                        if fragment.cmd == '__INCLUDE':
+                            submit(workdir, fragment.symbol)
+
+    def build(self, programs):
+        """ One failed program does not stop the others
+
+        :param programs: list of (workdir, filename)
+        :return: list of `DCPUTranslator.asm2bin` results in the same order,
+            `TranslationError` in place of a program which failed
+        """
+        self.encode_all(programs)
+
+        results = []
+        for workdir, filename in programs:
+            try:
+                results.append(self.translator.asm2bin(workdir, filename))
+            except TranslationError as ex:
+                results.append(ex)
+            except Exception as ex:
+                results.append(DCPUTranslator.error(filename, 0, '', f'Internal error: {ex!r}'))
+
+        return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filenames', nargs='+')
+    parser.add_argument('--jobs', type=int, default=None)
+    args = parser.parse_args()
+
+    programs = [os.path.split(filename) for filename in args.filenames]
+
+    builder = ParallelBuilder(args.jobs)
+    failed = 0
+
+    for (workdir, filename), program in zip(programs, builder.build(programs)):
+        if isinstance(program, TranslationError):
+            print(program.message)
+            failed += 1
+            continue
+
+        save_program(program, os.path.join(workdir, f'{os.path.splitext(filename)[0]}.bin'))
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,138 @@
+import argparse
+import hashlib
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from constants import CPU_FREQUENCY
+from emulator import Emulator
+from renderer import DisplayRenderer
+
+
+def frame_rgb(frame: np.ndarray) -> np.ndarray:
+    """ `rgb32` frame -> (height, width, 3) uint8 """
+    return ((frame[:, :, None] >> np.array([16, 8, 0], dtype=np.uint32)) & 0xff).astype(np.uint8)
+
+
+def frame_hash(frame: np.ndarray) -> str:
+    """ Digest of the RGB pixels, for visual regression checks """
+    return hashlib.sha1(np.ascontiguousarray(frame_rgb(frame)).tobytes()).hexdigest()
+
+
+def encode_png(rgb: np.ndarray) -> bytes:
+    """ (height, width, 3) uint8 -> PNG file data """
+    height, width, _ = rgb.shape
+
+    # every scanline starts with filter type 0 (none)
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgb.reshape(height, width * 3)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)),
+        chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)),
+        chunk(b'IEND', b''),
+    ])
+
+
+class PngSequenceWriter:
+    """ Writes every frame to `<directory>/frame_00000.png` ... """
+
+    def __init__(self, directory, pattern='frame_{:05d}.png'):
+        self.directory = directory
+        self.pattern = pattern
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, index, rgb):
+        with open(os.path.join(self.directory, self.pattern.format(index)), 'wb') as f:
+            f.write(encode_png(rgb))
+
+    def close(self):
+        pass
+
+
+class RawVideoWriter:
+    """ Appends frames to a headerless rgb24 stream, e.g. for
+        `ffmpeg -f rawvideo -pix_fmt rgb24 -s 144x112 -r 60 -i <file> out.mp4`
+    """
+
+    def __init__(self, filename):
+        self.file = open(filename, 'wb')
+
+    def write(self, index, rgb):
+        self.file.write(np.ascontiguousarray(rgb).tobytes())
+
+    def close(self):
+        self.file.close()
+
+
+class FrameCapture:
+    """ Runs the emulator without Qt and grabs display frames.
+
+    Vertical sync is driven by emulated cycles, not by wall time: a frame
+    is taken every `CPU_FREQUENCY / fps` cycles, so captures are the same
+    on every run regardless of host speed.
+    """
+
+    def __init__(self, emulator: Emulator, fps=60):
+        self.emulator = emulator
+        self.fps = fps
+        self.cycles_per_frame = CPU_FREQUENCY / fps
+        self.renderer = DisplayRenderer(emulator.get_hardware_by_name('display'))
+
+    def frames(self, count=None):
+        """ Generates (index, frame) until `count` frames are taken or the
+            program runs out of instructions
+        """
+        index = 0
+        vsync = self.cycles_per_frame
+
+        for _ in self.emulator.run_step():
+            while self.emulator.cycles >= vsync:
+                if count is not None and index >= count:
+                    return
+
+                yield index, self.renderer.render(DisplayRenderer.blink_phase(index / self.fps))
+
+                index += 1
+                vsync = (index + 1) * self.cycles_per_frame
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filename')
+    parser.add_argument('--frames', type=int, default=60)
+    parser.add_argument('--fps', type=int, default=60)
+    parser.add_argument('--png', type=str, default=None, help='directory for PNG sequence')
+    parser.add_argument('--raw', type=str, default=None, help='rgb24 video stream file')
+    parser.add_argument('--hashes', action='store_true', default=False)
+    args = parser.parse_args()
+
+    emulator = Emulator(debug=False)
+    emulator.preload(args.filename)
+
+    writers = []
+    if args.png:
+        writers.append(PngSequenceWriter(args.png))
+    if args.raw:
+        writers.append(RawVideoWriter(args.raw))
+
+    try:
+        for frame_num, frame in FrameCapture(emulator, args.fps).frames(args.frames):
+            rgb = frame_rgb(frame)
+            for writer in writers:
+                writer.write(frame_num, rgb)
+
+            if args.hashes:
+                print(f'{frame_num:05d} {frame_hash(frame)}')
+    except Exception as ex:
+        # emulator reports CPU faults (e.g. running off the program) as plain exceptions
+        print(f'Emulation stopped at PC 0x{emulator.regs.PC:04x}, cycle {emulator.cycles}: {ex}')
+    finally:
+        for writer in writers:
+            writer.close()
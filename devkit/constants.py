@@ -92,6 +92,18 @@ SPECIAL_MNEMONICS_TO_CODE = {
     'BRK': 0x1f,
 }
 
+# base cost in cycles, every next word adds one more
+CYCLES = {
+    'SET': 1, 'ADD': 2, 'SUB': 2, 'MUL': 2, 'MLI': 2, 'DIV': 3, 'DVI': 3, 'MOD': 3, 'MDI': 3,
+    'AND': 1, 'BOR': 1, 'XOR': 1, 'SHR': 1, 'ASR': 1, 'SHL': 1,
+    'IFB': 2, 'IFC': 2, 'IFE': 2, 'IFN': 2, 'IFG': 2, 'IFA': 2, 'IFL': 2, 'IFU': 2,
+    'ADX': 3, 'SBX': 3, 'STI': 2, 'STD': 2,
+    'JSR': 3, 'INT': 4, 'IAG': 1, 'IAS': 1, 'RFI': 3, 'IAQ': 2, 'HWN': 2, 'HWQ': 4, 'HWI': 4, 'BRK': 1,
+}
+
+# DCPU-16 runs at 100 kHz
+CPU_FREQUENCY = 100000
+
 BIN2OPCODE = {v: k for k, v in MNEMONIC_TO_CODE.items()}
 BIN2SPECTIAL = {v: k for k, v in SPECIAL_MNEMONICS_TO_CODE.items()}
 
@@ -8,18 +8,23 @@ from pathlib import Path
 from typing import List
 
 from PyQt5 import QtWidgets, QtGui
-from PyQt5.QtCore import QTimer, Qt, QEvent, QCoreApplication, QPoint
-from PyQt5.QtGui import QImage, QPixmap, qRgb, QPalette, QColor, QIcon
+from PyQt5.QtCore import QTimer, Qt, QEvent, QPoint
+from PyQt5.QtGui import QImage, QPixmap, QPalette, QColor, QIcon, QCursor
 from PyQt5.QtWidgets import QGraphicsScene, QLabel, QFileDialog, QMessageBox, QDesktopWidget, QMenu, QTableWidgetItem
 
+from assembler_thread import AssemblerThread
 from create_project_window import CreateProjectWindow
 from editor_window import EditorWindow
 from emulator import Emulator
-from hardware import Keyboard, Sensor, Door, DockingClamp, Antenna, Clock
+from emulator_thread import EmulatorThread
+from hardware import Keyboard, Sensor, Door, DockingClamp, Antenna
 import devkit_ui
 
 from project.project import Project
-from translator import DCPUTranslator, TranslationError
+from renderer import DisplayRenderer
+from source_map import SourceMap, map_location
+from symbols import SymbolIndex
+from translator import DCPUTranslator, TranslationError, TranslationErrors, save_program
 
 
 class EmulationState(Enum):
@@ -34,6 +39,9 @@ class DevKitApp(QtWidgets.QMainWindow, devkit_ui.Ui_MainWindow):
     emulator = None
     image = None
     scene = None
+    renderer = None
+    frames = None
+    blink_phase = None
     emulator_state = EmulationState.INITIAL
     timers = []
     mode = None
@@ -41,26 +49,39 @@ class DevKitApp(QtWidgets.QMainWindow, devkit_ui.Ui_MainWindow):
     def __init__(self, project_file):
         super().__init__()
 
-        self.last_go_to_definition = time.time()
-
-        self.next_instruction = None
+        self.jumping_to_definition = False
+
+        self.worker = None
+        self.break_at = None
+        self.breakpoints = set()
+        self.register_values = {}
+        self.hardware_versions = {}
+        self.variables_table = []
+        self.variable_values = []
+        self.translator = DCPUTranslator()
+        self.symbol_index = SymbolIndex(self.translator)
+        self.source_map = SourceMap()
         self.project_file = project_file
         self.editor_windows = {}
 
         self.setupUi(self)
         self.move_window_to_center()
 
+        self.setup_assembler()
         self.setup_editor()
 
         if project_file:
             self.project = Project.load_from_file(project_file)
             self.setup_project_tree()
 
+        self.speed_multiplier = 1
+
         self.setup_display()
         self.setup_emulator()
         self.setup_keyboard()
         self.setup_doors()
         self.setup_antenna()
+        self.setup_sensors()
         self.setup_hardware()
 
         # menu buttons
@@ -71,10 +92,64 @@ class DevKitApp(QtWidgets.QMainWindow, devkit_ui.Ui_MainWindow):
         self.actionReset.triggered.connect(self.action_reset)
 
         # speed combobox
-        self.speed_multiplier = 1
         self.speed_changed()
         self.speed.currentIndexChanged.connect(self.speed_changed)
 
+    def setup_assembler(self):
+        """ Rebuild in background once typing pauses, see `AssemblerThread` """
+        self.assembler = None
+        self.last_build = None
+
+        self.assemble_timer = QTimer(self)
+        self.assemble_timer.setSingleShot(True)
+        self.assemble_timer.setInterval(500)
+        self.assemble_timer.timeout.connect(self.assemble_in_background)
+
+        timer = QTimer(self)
+        timer.setInterval(50)
+        timer.timeout.connect(self.poll_assembler)
+        timer.start()
+        self.timers.append(timer)
+
+    def start_assembler(self):
+        self.stop_assembler()
+        self.last_build = None
+
+        if self.project.main_file:
+            self.assembler = AssemblerThread(self.project.location, self.project.main_file)
+            self.assembler.start()
+            self.assemble_in_background()
+
+    def stop_assembler(self):
+        if self.assembler:
+            self.assembler.stop()
+            self.assembler = None
+
+    def buffers_key(self):
+        """ Changes whenever text in any open editor changes """
+        return tuple(
+            (filename, editor.code.document().revision()) for filename, editor in sorted(self.editor_windows.items())
+        )
+
+    def assemble_in_background(self):
+        if self.assembler is None:
+            return
+
+        sources = {filename: editor.code.toPlainText() for filename, editor in self.editor_windows.items()}
+        self.assembler.submit(self.buffers_key(), sources)
+
+    def poll_assembler(self):
+        """ Shows diagnostics of the latest background build in editors """
+        if self.assembler is None or not self.assembler.builds:
+            return
+
+        self.last_build = self.assembler.builds.pop()
+        for filename, editor in self.editor_windows.items():
+            editor.code.set_diagnostics(self.last_build.diagnostics(filename))
+
+        if self.last_build.ok:
+            self.symbol_index.set_addresses(self.last_build.labels)
+
     def setup_editor(self):
         self.project_view_model = QtGui.QStandardItemModel()
         self.project_view_model.setHorizontalHeaderLabels(['Name'])
@@ -143,24 +218,87 @@ class DevKitApp(QtWidgets.QMainWindow, devkit_ui.Ui_MainWindow):
             self.editor_windows[filename].activateWindow()
             return
 
-        editor_window = EditorWindow(self.project.location, filename, self.go_to_definition)
+        editor_window = EditorWindow(
+            self.project.location, filename, self.go_to_definition, self.file_saved, self.show_references,
+            self.toggle_breakpoint,
+        )
         editor_window.show()
+        self.update_gutter(editor_window)
+
+        if self.last_build is not None:
+            editor_window.code.set_diagnostics(self.last_build.diagnostics(filename))
+        editor_window.code.textChanged.connect(self.assemble_timer.start)
+        self.assemble_in_background()
 
         self.editor_tabs.addTab(editor_window, filename)
 
         self.editor_windows[filename] = editor_window
 
     def go_to_definition(self, text):
-        if time.time() - self.last_go_to_definition < 1:
+        # selecting the line moves the cursor, which calls back here
+        if self.jumping_to_definition:
+            return
+
+        location = self.symbol_index.definition(text)
+        if location is None:
             return
 
-        self.last_go_to_definition = time.time()
-        for file in self.project.files:
-            with open(os.path.join(self.project.location, file), 'r') as f:
-                for line_num, line in enumerate(f.readlines()):
-                    if line.strip().split(' ')[0] == f':{text}':
-                        self.select_line_in_editor(file, line_num)
-                        return
+        address = self.symbol_index.address(text)
+        if address is not None:
+            self.statusbar.showMessage(f'{text}: 0x{address:04x}')
+
+        self.jumping_to_definition = True
+        try:
+            self.select_line_in_editor(*location)
+        finally:
+            self.jumping_to_definition = False
+
+    def show_references(self, text):
+        """ Popup with all lines which use the symbol """
+        menu = QMenu()
+        for filename, line_num in self.symbol_index.find_references(text):
+            action = menu.addAction(f'{filename}:{line_num + 1}')
+            action.triggered.connect(partial(self.select_line_in_editor, filename, line_num))
+
+        if menu.isEmpty():
+            menu.addAction(f'No references to {text}').setEnabled(False)
+
+        menu.exec_(QCursor.pos())
+
+    def update_gutter(self, editor_window):
+        exec_counts = self.emulator.exec_counts if self.emulator else None
+        editor_window.code.set_gutter(
+            self.source_map.line_to_pc(editor_window.filename), exec_counts, self.breakpoints,
+        )
+
+    def update_gutters(self):
+        """ New build or emulator: every editor gets the new tables """
+        for editor_window in self.editor_windows.values():
+            self.update_gutter(editor_window)
+
+    def toggle_breakpoint(self, address):
+        self.breakpoints ^= {address}
+        self.push_breakpoints()
+
+        for editor_window in self.editor_windows.values():
+            editor_window.code.lineNumberArea.update()
+
+    def push_breakpoints(self):
+        """ Gutter breakpoints and "stop at" address to the emulator thread """
+        pcs = set(self.breakpoints)
+        if self.break_at is not None:
+            pcs.add(self.break_at)
+
+        if self.worker:
+            self.worker.set_breakpoints(pcs)
+
+    def push_variables(self):
+        """ Addresses of the variables table, the emulator thread snapshots their words """
+        if self.worker:
+            self.worker.set_variables(address for _, address in self.variables_table)
+
+    def file_saved(self, filename):
+        self.symbol_index.update_file(self.project.location, filename)
 
     def close_source_file(self, index):
         editor: EditorWindow = self.editor_tabs.widget(index)
@@ -169,6 +307,7 @@ class DevKitApp(QtWidgets.QMainWindow, devkit_ui.Ui_MainWindow):
         self.editor_windows.pop(editor.filename, None)
 
         self.editor_tabs.removeTab(index)
+        self.assemble_in_background()
 
     def move_window_to_center(self):
         center_point = QDesktopWidget().availableGeometry().center()
@@ -180,6 +319,9 @@ class DevKitApp(QtWidgets.QMainWindow, devkit_ui.Ui_MainWindow):
         icon_file = QIcon(os.path.join('img', 'asm_file.png'))
         icon_main_file = QIcon(os.path.join('img', 'main_asm_file.png'))
 
+        self.symbol_index = SymbolIndex(self.translator)
+        self.symbol_index.index_project(self.project.location, self.project.files)
+
         self.project_view_model.setRowCount(0)
         self.project_view.setRootIsDecorated(False)
         for filename in self.project.files:
@@ -191,6 +333,8 @@ class DevKitApp(QtWidgets.QMainWindow, devkit_ui.Ui_MainWindow):
 
         self.editor_windows.clear()
 
+        self.start_assembler()
+
     def setup_keyboard(self):
         self.keyboard.installEventFilter(self)
 
@@ -200,7 +344,7 @@ class DevKitApp(QtWidgets.QMainWindow, devkit_ui.Ui_MainWindow):
     def send_antenna_msg(self):
         antennas: List[Antenna] = self.emulator.get_all_hardware_by_name('antenna')
         for antenna in antennas:
-            antenna.recv_message([ord(c) for c in self.recv_buffer.text()])
+            self.worker.call(antenna.recv_message, [ord(c) for c in self.recv_buffer.text()])
             self.recv_buffer.clear()
 
     def setup_emulator(self):
@@ -208,15 +352,16 @@ class DevKitApp(QtWidgets.QMainWindow, devkit_ui.Ui_MainWindow):
             self.action_reset()
 
         emu_timer = QTimer(self)
-        emu_timer.setInterval(1)
-        emu_timer.timeout.connect(self.step_instruction)
+        emu_timer.setInterval(16)
+        emu_timer.timeout.connect(self.poll_emulator)
         emu_timer.start()
         self.timers.append(emu_timer)
 
     def setup_display(self):
-        self.image = QImage(128, 96, QImage.Format_RGB32)
+        self.image = QImage(DisplayRenderer.FRAME_WIDTH, DisplayRenderer.FRAME_HEIGHT, QImage.Format_RGB32)
+        self.image.fill(0)
         self.scene = QGraphicsScene()
-        self.scene.addPixmap(QPixmap.fromImage(self.image))
+        self.display_pixmap = self.scene.addPixmap(QPixmap.fromImage(self.image))
 
         self.display.setScene(self.scene)
         self.display.fitInView(self.scene.itemsBoundingRect(), Qt.KeepAspectRatio)
@@ -246,7 +391,7 @@ class DevKitApp(QtWidgets.QMainWindow, devkit_ui.Ui_MainWindow):
             state = 4
 
         doors: Door = self.emulator.get_hardware_by_name('door')
-        doors.change_state(door_id, Door.States(state))
+        self.worker.call(doors.change_state, door_id, Door.States(state))
 
     def setup_hardware(self):
         timer = QTimer(self)
@@ -257,6 +402,8 @@ class DevKitApp(QtWidgets.QMainWindow, devkit_ui.Ui_MainWindow):
 
     def speed_changed(self):
         self.speed_multiplier = 10 ** self.speed.currentIndex()
+        if self.worker:
+            self.worker.set_speed(self.speed_multiplier)
 
     def action_create_project(self):
         self.create_project_window = CreateProjectWindow()
@@ -284,6 +431,7 @@ class DevKitApp(QtWidgets.QMainWindow, devkit_ui.Ui_MainWindow):
             self.retranslate()
 
         self.emulator_state = EmulationState.STEP_REQUESTED
+        self.worker.step()
         self.actionReset.setEnabled(True)
 
     def action_run(self):
@@ -291,21 +439,39 @@ class DevKitApp(QtWidgets.QMainWindow, devkit_ui.Ui_MainWindow):
             self.retranslate()
 
         self.emulator_state = EmulationState.RUN_FAST
+        self.worker.resume()
         self.actionReset.setEnabled(True)
 
     def action_reset(self):
-        self.last_frame = []
         if not self.project_file or not self.project.main_file:
             return
 
+        self.stop_worker()
+
         self.emulator = Emulator(debug=False)
+        self.renderer = DisplayRenderer(self.emulator.get_hardware_by_name('display'))
         self.load_project_files()
 
         self.emulator_state = EmulationState.LOADED
 
-        self.next_instruction = self.emulator.run_step()
+        self.worker = EmulatorThread(self.emulator, self.renderer)
+        self.worker.set_speed(self.speed_multiplier)
+        self.push_breakpoints()
+        self.push_variables()
+        self.worker.start()
+
+        self.update_gutters()
+
+        self.hardware_versions = {}
+        for num in range(2):
+            self.push_sensor_contacts(num)
         self.actionReset.setEnabled(False)
 
+    def stop_worker(self):
+        if self.worker:
+            self.worker.stop()
+            self.worker = None
+
     def eventFilter(self, source, event):
         # keyboard support
         if event.type() in (QEvent.KeyPress, QEvent.KeyRelease):
@@ -339,11 +505,13 @@ class DevKitApp(QtWidgets.QMainWindow, devkit_ui.Ui_MainWindow):
                     return super().eventFilter(source, event)
 
             keyboard: Keyboard = self.emulator.get_hardware_by_name('keyboard')
-            keyboard.handle_key_event(key, event.type() == QEvent.KeyPress)
+            self.worker.call(keyboard.handle_key_event, key, event.type() == QEvent.KeyPress)
 
         return super().eventFilter(source, event)
 
     def closeEvent(self, event):
+        self.stop_worker()
+        self.stop_assembler()
         for editor in self.editor_windows.values():
             editor.close()
 
@@ -359,116 +527,65 @@ class DevKitApp(QtWidgets.QMainWindow, devkit_ui.Ui_MainWindow):
     def _retranslate(self):
         # save all changes
         for editor in self.editor_windows.values():
-            editor.save_file()
+            editor.save_file(wait=True)
 
-        self.pc_to_line = {}
-
-        tr = DCPUTranslator()
+        tr = self.translator
 
         bin_location = os.path.join(self.project.location, f'{self.project.name}.bin')
-        with open(bin_location, 'wb') as f:
-            pc = 0
-            for file, line_num, _, instructions in tr.asm2bin(self.project.location, self.project.main_file):
-                for code in instructions:
-                    f.write(code.to_bytes(2, byteorder='little'))
-                    # TODO: refactor this
-                self.pc_to_line[pc] = (file, line_num)
-                pc += len(instructions)
 
-        self.emulator.preload(bin_location)
+        # background build of the same text is already done
+        build = self.last_build
+        if build is not None and build.key == self.buffers_key():
+            if not build.ok:
+                raise TranslationErrors(build.errors)
+            labels, program, dat_labels = build.labels, build.program, build.dat_labels
+        else:
+            dat_labels = []
+            labels, program = tr.translate(self.project.location, self.project.main_file, dat_labels)
 
-    def load_project_files(self):
-        """ Reads .bin file, decodes instructions
-            saves PC-to-instruction info.
-        """
-        self.pc_to_line = {}
+        self.source_map = save_program(program, bin_location)
+        self.setup_variables(labels, dat_labels)
+        self.symbol_index.set_addresses(labels)
+        self.update_gutters()
 
-        # translate and then load
-        translator = DCPUTranslator()
-        try:
-            pc = 0
-            for file, line_num, line, instructions in translator.asm2bin(self.project.location, self.project.main_file):
-                self.pc_to_line[pc] = (file, line_num)
-                pc += len(instructions)
+        self.worker.call(self.emulator.preload, bin_location)
 
-        except Exception as ex:
-            print(ex)
+    def load_project_files(self):
+        """ Loads PC-to-line info from the source map of the last build """
+        self.source_map = SourceMap()
 
-    # hack for save some cycles while drawing
-    last_frame = []
-    last_vram = []
-    last_fram = []
-    last_pram = []
+        map_file = map_location(os.path.join(self.project.location, f'{self.project.name}.bin'))
+        try:
+            self.source_map = SourceMap.load(map_file)
+        except (OSError, ValueError):
+            # not built yet or unreadable, lookups just find nothing
+            pass
 
     def draw_display(self):
         if self.emulator is None or self.emulator_state in (EmulationState.INITIAL, EmulationState.LOADED):
             return
 
-        display_hw = self.emulator.get_hardware_by_name('display')
-
-        palette = display_hw.load_palette(qRgb)
-
-        vram = display_hw.video_ram
-        fram = display_hw.font_ram
-        pram = display_hw.palette_ram
-
-        redraw = self.last_vram != vram or self.last_fram != fram or self.last_pram != pram
-
-        if not self.last_frame or redraw:
-            self.last_frame = self.emulator.ram[vram:32 * 12]
-            self.last_vram = vram
-            self.last_fram = fram
-            self.last_pram = pram
-
-        for y in range(12):
-            for x in range(32):
-                val = self.emulator.ram[vram + x + y * 32]
-
-                if not self._is_symbol_changed(val, x, y):
-                    continue
-
-                char = val & 0x007f
-                blink = val & 0x0080
-                bgcolor = (val & 0x0f00) >> 8
-                fgcolor = (val & 0xf000) >> 12
-
-                hi, lo = display_hw.get_char(char)
-
-                offset_x = x*4
-                offset_y = y*8
+        phase = DisplayRenderer.blink_phase(time.time())
+        if self.worker.frames:
+            self.frames = self.worker.frames.pop()
+        elif phase == self.blink_phase:
+            return
+        self.blink_phase = phase
 
-                for xx in range(4):
-                    for yy in range(8):
-                        b = 2 ** yy
-                        if xx == 0:
-                            v = hi >> 8 & b
-                        elif xx == 1:
-                            v = hi & b
-                        elif xx == 2:
-                            v = lo >> 8 & b
-                        else:
-                            v = lo & b
+        if self.frames is None:
+            return
 
-                        self.image.setPixel(offset_x+xx, offset_y+yy, palette[fgcolor] if v else palette[bgcolor])
+        ptr = self.image.bits()
+        ptr.setsize(self.image.byteCount())
+        DisplayRenderer.blit(self.frames[phase], ptr)
 
-        self.scene.clear()
-        self.scene.addPixmap(QPixmap.fromImage(self.image))
-        self.display.fitInView(self.scene.itemsBoundingRect(), Qt.KeepAspectRatio)
-
-    def _is_symbol_changed(self, val, x, y):
-        try:
-            if val == self.last_frame[x + y * 32]:
-                return False
-            else:
-                self.last_frame[x + y * 32] = val
-        except IndexError:
-            pass
-
-        return True
+        self.display_pixmap.setPixmap(QPixmap.fromImage(self.image))
 
     def update_hardware_ui(self):
+        """ Refreshes widgets of devices which changed since the last call """
         if not self.emulator:
             return
+
         # set thrusters UI
         thrusters = [
             self.thruster0,
@@ -481,68 +598,84 @@ class DevKitApp(QtWidgets.QMainWindow, devkit_ui.Ui_MainWindow):
             self.thruster7,
         ]
         thruster = self.emulator.get_hardware_by_name('thruster')
-        for i in range(8):
-            label: QLabel = thrusters[i]
-            label.setText(str(thruster.power[i]))
+        if self._hardware_changed(thruster):
+            for i in range(8):
+                label: QLabel = thrusters[i]
+                label.setText(str(thruster.power[i]))
 
         # set keyboard buffer UI
         keyboard: Keyboard = self.emulator.get_hardware_by_name('keyboard')
-        self.keyboard_buffer.setText(
-            f'{",".join([chr(c) for c in keyboard.buffer])}'[:50])
-
-        # update sensors from UI
-
-        sensors: List[Sensor] = self.emulator.get_all_hardware_by_name('sensor')
-
-        for num, contacts in enumerate([self.contacts, self.contacts_2]):
-            data = []
-            for i in range(7):
-                type_ = contacts.item(i, 0)
-                id_ = contacts.item(i, 1)
-                size = contacts.item(i, 2)
-                range_ = contacts.item(i, 3)
-                angle = contacts.item(i, 4)
-
-                try:
-                    data.append({
-                        'type': int(type_.text(), 16),
-                        'id': int(id_.text(), 16),
-                        'size': int(size.text(), 16),
-                        'range': int(range_.text(), 16),
-                        'angle': int(angle.text(), 16),
-                    })
-                except Exception:
-                    continue
-
-            try:
-                sensor = sensors[num]
-                if sensor:
-                    sensor.update_sensor(data)
-            except IndexError:
-                pass
+        if self._hardware_changed(keyboard):
+            self.keyboard_buffer.setText(
+                f'{",".join([chr(c) for c in keyboard.buffer])}'[:50])
 
         doors: Door = self.emulator.get_hardware_by_name('door')
-        if doors:
+        if self._hardware_changed(doors):
             self.door_head.setText(f'Door {doors.mode[0].name}')
             self.door_left.setText(f'Door {doors.mode[1].name}')
             self.door_right.setText(f'Door {doors.mode[2].name}')
 
         clamps: DockingClamp = self.emulator.get_hardware_by_name('docking_clamp')
-        if clamps:
+        if self._hardware_changed(clamps):
             self.clamp_l_u.setText(f'Clamp {clamps.mode[0].name}')
             self.clamp_l_d.setText(f'Clamp {clamps.mode[1].name}')
             self.clamp_r_u.setText(f'Clamp {clamps.mode[2].name}')
             self.clamp_r_d.setText(f'Clamp {clamps.mode[3].name}')
 
-        antenna: Antenna = self.emulator.get_hardware_by_name('anthenna')
-        if antenna:
-            self.send_buffer.setText(str(antenna.send_buffer))
+        antenna: Antenna = self.emulator.get_hardware_by_name('antenna')
+        if self._hardware_changed(antenna):
+            self.send_buffer.setText(' | '.join(
+                ''.join(chr(word) if 32 <= word < 127 else '.' for word in msg) for msg in antenna.send_buffer
+            )[:50])
+
+    def _hardware_changed(self, hardware) -> bool:
+        """ True once for every new `Hardware.version` of the device """
+        if not hardware:
+            return False
+
+        if self.hardware_versions.get(id(hardware)) == hardware.version:
+            return False
+
+        self.hardware_versions[id(hardware)] = hardware.version
+        return True
 
-    def step_instruction(self):
-        if self.emulator_state not in {EmulationState.STEP_REQUESTED, EmulationState.RUN_FAST}:
+    def setup_sensors(self):
+        for num, contacts in enumerate([self.contacts, self.contacts_2]):
+            contacts.itemChanged.connect(partial(self.push_sensor_contacts, num))
+
+    def push_sensor_contacts(self, num, *_):
+        """ Sends contacts table `num` to its sensor, called on edit """
+        if not self.emulator:
             return
 
-        if self.next_instruction is None:
+        contacts = [self.contacts, self.contacts_2][num]
+
+        data = []
+        for i in range(7):
+            type_ = contacts.item(i, 0)
+            id_ = contacts.item(i, 1)
+            size = contacts.item(i, 2)
+            range_ = contacts.item(i, 3)
+            angle = contacts.item(i, 4)
+
+            try:
+                data.append({
+                    'type': int(type_.text(), 16),
+                    'id': int(id_.text(), 16),
+                    'size': int(size.text(), 16),
+                    'range': int(range_.text(), 16),
+                    'angle': int(angle.text(), 16),
+                })
+            except Exception:
+                continue
+
+        sensors: List[Sensor] = self.emulator.get_all_hardware_by_name('sensor')
+        if num < len(sensors):
+            self.worker.call(sensors[num].update_sensor, data)
+
+    def poll_emulator(self):
+        """ Picks up stops and state published by the emulator thread """
+        if self.worker is None:
             return
 
         break_at = self.stop_at.text()
@@ -554,43 +687,35 @@ class DevKitApp(QtWidgets.QMainWindow, devkit_ui.Ui_MainWindow):
         except:
             break_at = None
 
-        for i in range(self.speed_multiplier):
-            # give some air to display thread
-            if i % 100 == 0:
-                QCoreApplication.processEvents()
-
-            try:
-                if self.emulator_state not in (EmulationState.STEP_REQUESTED, EmulationState.RUN_FAST):
-                    break
-
-                pc, is_brk = next(self.next_instruction)
-                if is_brk or pc == break_at:
-                    self.emulator_state = EmulationState.STEP_REQUESTED
+        if break_at != self.break_at:
+            self.break_at = break_at
+            self.push_breakpoints()
 
-                clock: Clock = self.emulator.get_hardware_by_name('clock')
-                clock.update()
+        while self.worker.events:
+            snapshot = self.worker.events.popleft()
 
-            except Exception as ex:
-                print(f'Exception: {ex}')
-                QMessageBox.warning(self, 'Error', f'Emulator halted. Reason: {ex}')
+            if snapshot.error is not None or snapshot.stop == 'halt':
+                reason = snapshot.error or 'no more instructions'
+                print(f'Exception: {reason}')
+                QMessageBox.warning(self, 'Error', f'Emulator halted. Reason: {reason}')
                 self.action_reset()
-                break
-
-            if self.emulator_state is EmulationState.STEP_REQUESTED:
-                self.emulator_state = EmulationState.STEP_PREFORMED
-                self._dump_registers()
+                return
 
-                try:
-                    select_file, select_line = self.pc_to_line[pc]
-                except:
-                    break
+            self.emulator_state = EmulationState.STEP_PREFORMED
+            self._dump_registers(snapshot)
 
-                self.select_line_in_editor(select_file, select_line)
+            location = self.source_map.lookup(snapshot.pc)
+            if location is not None:
+                self.select_line_in_editor(*location)
+                self.editor_windows[location[0]].code.lineNumberArea.update()
 
-                QCoreApplication.processEvents()
-                break
+        if self.emulator_state is EmulationState.RUN_FAST and self.worker.snapshots:
+            self._dump_registers(self.worker.snapshots.pop())
 
-        self._dump_registers()
+            # execution counts, only visible lines are repainted
+            editor_window = self.editor_tabs.currentWidget()
+            if editor_window is not None:
+                editor_window.code.lineNumberArea.update()
 
     def select_line_in_editor(self, select_file, select_line):
         if select_file not in self.editor_windows:
@@ -598,29 +723,31 @@ class DevKitApp(QtWidgets.QMainWindow, devkit_ui.Ui_MainWindow):
         self.editor_windows[select_file].select_line(select_line)
         self.editor_tabs.setCurrentWidget(self.editor_windows[select_file])
 
-    def _dump_registers(self):
+    def _dump_registers(self, snapshot):
         for i, reg in enumerate(['A', 'B', 'C', 'X', 'Y', 'Z', 'I', 'J', 'SP', 'PC', 'EX', 'IA']):
-            item = self.registers.item(i, 0)
-            item.setText(f'0x{self.emulator.regs[reg]:04x}')
-
-        # variables hack
-        tr = DCPUTranslator()
-        dat_labels = []
-        try:
-            labels, _ = tr.translate(self.project.location, self.project.main_file, None, dat_labels)
-
-            self.variables.setRowCount(0)
-
-            for k in sorted(labels.keys()):
-                if k in dat_labels:
-                    value = labels[k]
-                    row_position = self.variables.rowCount()
-                    self.variables.insertRow(row_position)
-                    self.variables.setItem(row_position, 0, QTableWidgetItem(k))
-                    self.variables.setItem(row_position, 1, QTableWidgetItem(f'0x{self.emulator.ram[value]:04x}'))
-        except TranslationError:
-            print('Failed to dump variables')
-            pass
+            value = snapshot.regs[reg]
+            if self.register_values.get(reg) != value:
+                self.register_values[reg] = value
+                self.registers.item(i, 0).setText(f'0x{value:04x}')
+
+        for row, (name, address) in enumerate(self.variables_table):
+            # snapshots taken before the thread got new addresses lack them
+            value = snapshot.variables.get(address)
+            if value is not None and self.variable_values[row] != value:
+                self.variable_values[row] = value
+                self.variables.item(row, 1).setText(f'0x{value:04x}')
+
+    def setup_variables(self, labels, dat_labels):
+        """ Fills variables table with DAT labels of the last build """
+        self.variables_table = sorted((name, labels[name]) for name in set(dat_labels))
+        self.variable_values = [None] * len(self.variables_table)
+
+        self.variables.setRowCount(len(self.variables_table))
+        for row, (name, _) in enumerate(self.variables_table):
+            self.variables.setItem(row, 0, QTableWidgetItem(name))
+            self.variables.setItem(row, 1, QTableWidgetItem(''))
+
+        self.push_variables()
 
 
 def force_dark_mode():
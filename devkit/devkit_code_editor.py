@@ -4,12 +4,15 @@
 
 # https://stackoverflow.com/questions/40386194/create-text-area-textedit-with-line-number-in-pyqt
 
-from PyQt5.QtCore import Qt, QRect, QSize, QRegExp
-from PyQt5.QtWidgets import QWidget, QPlainTextEdit, QTextEdit
+from functools import lru_cache
+
+from PyQt5.QtCore import Qt, QEvent, QPoint, QRect, QSize
+from PyQt5.QtWidgets import QWidget, QPlainTextEdit, QTextEdit, QToolTip
 from PyQt5.QtGui import QColor, QPainter, QTextFormat, QTextCharFormat, QFont, \
     QSyntaxHighlighter, QGuiApplication, QTextCursor
 
 from constants import MNEMONIC_TO_CODE, SPECIAL_MNEMONICS_TO_CODE
+from lexer import tokenize_line
 
 
 class QLineNumberArea(QWidget):
@@ -18,17 +21,42 @@ class QLineNumberArea(QWidget):
         self.codeEditor = editor
 
     def sizeHint(self):
-        return QSize(self.editor.lineNumberAreaWidth(), 0)
+        return QSize(self.codeEditor.lineNumberAreaWidth(), 0)
 
     def paintEvent(self, event):
         self.codeEditor.lineNumberAreaPaintEvent(event)
 
+    def mousePressEvent(self, event):
+        self.codeEditor.lineNumberAreaClicked(event.pos().y())
+
 
 class QCodeEditor(QPlainTextEdit):
-    def __init__(self, parent=None, pc_to_line=None, editmode=False, click_cback=None):
+    """ Code editor with an address gutter.
+
+    After a build the gutter shows the address of every line with code,
+    how many times it was executed and a marker on breakpoints. All of it
+    is indexed by line (see `set_gutter`), so a repaint only reads the
+    entries of visible lines.
+    """
+
+    ADDRESS_DIGITS = 6
+    COUNT_DIGITS = 6
+
+    def __init__(self, parent=None, click_cback=None, breakpoint_cback=None):
         super().__init__(parent)
 
         self.click_cback = click_cback
+        self.breakpoint_cback = breakpoint_cback
+        self.highlighter = None
+
+        # see `set_gutter`
+        self.line_to_pc = None
+        self.exec_counts = None
+        self.breakpoints = frozenset()
+
+        # see `set_diagnostics`
+        self.diagnostics = {}
+        self.diagnostic_selections = []
 
         self.lineNumberArea = QLineNumberArea(self)
         self.blockCountChanged.connect(self.updateLineNumberAreaWidth)
@@ -36,19 +64,70 @@ class QCodeEditor(QPlainTextEdit):
         self.cursorPositionChanged.connect(self.highlightCurrentLine)
         self.updateLineNumberAreaWidth(0)
 
-        if editmode is False:
-            self.line_to_pc = {line: pc for pc, line in pc_to_line.items()}
-        else:
-            self.line_to_pc = None
+    def set_gutter(self, line_to_pc=None, exec_counts=None, breakpoints=frozenset()):
+        """
+        :param line_to_pc: PC of every line, -1 for no code (see `SourceMap.line_to_pc`)
+        :param exec_counts: executions of every PC (see `Emulator.exec_counts`)
+        :param breakpoints: PCs with a breakpoint
+        """
+        self.line_to_pc = line_to_pc
+        self.exec_counts = exec_counts
+        self.breakpoints = breakpoints
+        self.updateLineNumberAreaWidth(0)
+        self.lineNumberArea.update()
+
+    def set_diagnostics(self, diagnostics):
+        """ Underlines lines with errors and warnings, message is in the tooltip
+
+        :param diagnostics: line -> (severity: 'error' or 'warning', message)
+        """
+        self.diagnostics = diagnostics
+        self.diagnostic_selections = []
+
+        for line, (severity, _) in sorted(diagnostics.items()):
+            block = self.document().findBlockByNumber(line)
+            if not block.isValid():
+                continue
+
+            selection = QTextEdit.ExtraSelection()
+            selection.format.setUnderlineStyle(QTextCharFormat.WaveUnderline)
+            selection.format.setUnderlineColor(QColor(Qt.red if severity == 'error' else Qt.darkYellow))
+            selection.cursor = QTextCursor(block)
+            selection.cursor.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
+            self.diagnostic_selections.append(selection)
+
+        self.updateExtraSelections()
+
+    def viewportEvent(self, event):
+        if event.type() == QEvent.ToolTip:
+            diagnostic = self.diagnostics.get(self.cursorForPosition(event.pos()).blockNumber())
+            if diagnostic:
+                QToolTip.showText(event.globalPos(), diagnostic[1], self.viewport())
+            else:
+                QToolTip.hideText()
+            return True
+
+        return super().viewportEvent(event)
+
+    def line_address(self, line):
+        """ :return: PC of the line or None """
+        if self.line_to_pc is None or line >= len(self.line_to_pc) or self.line_to_pc[line] < 0:
+            return None
+
+        return self.line_to_pc[line]
 
     def lineNumberAreaWidth(self):
-        digits = 6
-        # max_value = max(1, self.blockCount())
-        # while max_value >= 10:
-        #     max_value /= 10
-        #     digits += 1
-        space = 3 + self.fontMetrics().width('9') * digits
-        return space
+        digits = self.ADDRESS_DIGITS
+        if self.exec_counts is not None:
+            digits += self.COUNT_DIGITS + 1
+
+        return 3 + self.fontMetrics().height() + self.fontMetrics().width('9') * digits
+
+    def lineNumberAreaClicked(self, y):
+        """ Click on the gutter toggles breakpoint of the line """
+        address = self.line_address(self.cursorForPosition(QPoint(0, y)).blockNumber())
+        if address is not None and self.breakpoint_cback:
+            self.breakpoint_cback(address)
 
     def updateLineNumberAreaWidth(self, _):
         self.setViewportMargins(self.lineNumberAreaWidth(), 0, 0, 0)
@@ -61,6 +140,26 @@ class QCodeEditor(QPlainTextEdit):
         if rect.contains(self.viewport().rect()):
             self.updateLineNumberAreaWidth(0)
 
+        self.highlight_visible()
+
+    def visible_blocks(self):
+        """ (first, last) numbers of blocks on screen, with one screen ahead """
+        first = self.firstVisibleBlock().blockNumber()
+        lines = self.viewport().height() // max(1, self.fontMetrics().height()) + 1
+        return first, first + 2 * lines
+
+    def highlight_visible(self):
+        """ Highlights blocks scrolled into view which were skipped so far """
+        if self.highlighter is None:
+            return
+
+        first, last = self.visible_blocks()
+        block = self.document().findBlockByNumber(first)
+        while block.isValid() and block.blockNumber() <= last:
+            if block.userState() == -1:
+                self.highlighter.rehighlightBlock(block)
+            block = block.next()
+
     def resizeEvent(self, event):
         super().resizeEvent(event)
         cr = self.contentsRect()
@@ -73,7 +172,10 @@ class QCodeEditor(QPlainTextEdit):
                 cursor.select(QTextCursor.WordUnderCursor)
                 self.click_cback(cursor.selectedText())
 
-        extraSelections = []
+        self.updateExtraSelections()
+
+    def updateExtraSelections(self):
+        extraSelections = list(self.diagnostic_selections)
         if not self.isReadOnly():
             selection = QTextEdit.ExtraSelection()
             lineColor = QColor(Qt.darkYellow).lighter(80)
@@ -85,35 +187,42 @@ class QCodeEditor(QPlainTextEdit):
         self.setExtraSelections(extraSelections)
 
     def lineNumberAreaPaintEvent(self, event):
-        try:
-            self._lineNumberAreaPaintEvent(event)
-        except:
-            pass
-
-    def _lineNumberAreaPaintEvent(self, event):
         painter = QPainter(self.lineNumberArea)
 
         painter.fillRect(event.rect(), Qt.darkGray)
 
         block = self.firstVisibleBlock()
         blockNumber = block.blockNumber()
-        top = self.blockBoundingGeometry(block).translated(self.contentOffset()).top()
-        bottom = top + self.blockBoundingRect(block).height()
+        top = int(self.blockBoundingGeometry(block).translated(self.contentOffset()).top())
+        bottom = top + int(self.blockBoundingRect(block).height())
 
         # Just to make sure I use the right font
         height = self.fontMetrics().height()
+        digit = self.fontMetrics().width('9')
+        address_right = height + digit * self.ADDRESS_DIGITS
+        width = self.lineNumberArea.width()
+
         while block.isValid() and (top <= event.rect().bottom()):
             if block.isVisible() and (bottom >= event.rect().top()):
-                if self.line_to_pc:
-                    number = f'0x{self.line_to_pc[blockNumber]:04x}' #str(blockNumber + 1)
-                else:
-                    number = str(blockNumber + 1)
+                address = self.line_address(blockNumber)
                 painter.setPen(Qt.black)
-                painter.drawText(0, top, self.lineNumberArea.width(), height, Qt.AlignRight, number)
+                if address is None:
+                    painter.drawText(0, top, address_right, height, Qt.AlignRight, str(blockNumber + 1))
+                else:
+                    if address in self.breakpoints:
+                        painter.setBrush(Qt.red)
+                        painter.drawEllipse(2, top + 2, height - 4, height - 4)
+
+                    painter.drawText(0, top, address_right, height, Qt.AlignRight, f'0x{address:04x}')
+
+                    count = self.exec_counts[address] if self.exec_counts is not None else 0
+                    if count:
+                        painter.setPen(Qt.darkBlue)
+                        painter.drawText(address_right, top, width - address_right - 3, height, Qt.AlignRight, str(count))
 
             block = block.next()
             top = bottom
-            bottom = top + self.blockBoundingRect(block).height()
+            bottom = top + int(self.blockBoundingRect(block).height())
             blockNumber += 1
 
 
@@ -147,67 +256,64 @@ STYLES = {
 }
 
 
+KEYWORDS = {
+    mnemonic for mnemonic in [*MNEMONIC_TO_CODE.keys(), *SPECIAL_MNEMONICS_TO_CODE.keys()]
+    if not mnemonic.startswith('unused')
+}
+
+# token kind -> style
+TOKEN_STYLES = {
+    'comment': 'comment',
+    'label': 'label',
+    'number': 'numbers',
+    'char': 'numbers',
+    'brace': 'brace',
+    'op': 'operator',
+}
+
+
+@lru_cache(maxsize=16384)
+def highlight_spans(line):
+    """ (start, length, style) for one line, cached by line text """
+    spans = []
+    first = True
+    for kind, start, end in tokenize_line(line):
+        style = TOKEN_STYLES.get(kind)
+        if kind == 'symbol' and line[start:end].upper() in KEYWORDS:
+            style = 'breakpoint' if first and line[start:end].upper() == 'BRK' else 'keyword'
+
+        if style:
+            spans.append((start, end - start, style))
+        first = False
+
+    return tuple(spans)
+
+
 class DCPUHighlighter(QSyntaxHighlighter):
     """Syntax highlighter for the DCPU language.
+
+    One scan of `lexer.tokenize_line` per block, token spans are cached
+    per line text, so rehighlighting does not re-tokenize unchanged lines.
+
+    With `visible_blocks` given, blocks off screen are skipped and left
+    in state -1, the editor highlights them when they scroll into view.
     """
-    keywords = [
-        *MNEMONIC_TO_CODE.keys(),
-        *SPECIAL_MNEMONICS_TO_CODE.keys()
-    ]
-
-    operators = [
-        '\+'
-    ]
-
-    braces = [
-        '\[', '\]',
-    ]
-
-    def __init__(self, document):
-        QSyntaxHighlighter.__init__(self, document)
-
-        rules = []
-
-        # Keyword, operator, and brace rules
-        rules += [(r'\b%s\b' % w, 0, STYLES['keyword'])
-                  for w in DCPUHighlighter.keywords]
-        rules += [(r'%s' % o, 0, STYLES['operator'])
-                  for o in DCPUHighlighter.operators]
-        rules += [(r'%s' % b, 0, STYLES['brace'])
-                  for b in DCPUHighlighter.braces]
-
-        # All other rules
-        rules += [
-            # Comments
-            (r';[^\n]*', 0, STYLES['comment']),
-
-            # Numeric literals
-            (r'\b[+-]?[0-9]+[lL]?\b', 0, STYLES['numbers']),
-            (r'\b[+-]?0[xX][0-9A-Fa-f]+[lL]?\b', 0, STYLES['numbers']),
-            (r'\b[+-]?[0-9]+(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?\b', 0, STYLES['numbers']),
-
-            # Labels
-            (r'\:[a-zA-Z0-9_]+', 0, STYLES['label']),
-            (r'^\s?BRK', 0, STYLES['breakpoint']),
-        ]
-
-        # Build a QRegExp for each pattern
-        self.rules = [(QRegExp(pat), index, fmt) for (pat, index, fmt) in rules]
+
+    def __init__(self, document, visible_blocks=None):
+        super().__init__(document)
+        self.visible_blocks = visible_blocks
 
     def highlightBlock(self, text):
         """Apply syntax highlighting to the given block of text.
         """
-        # Do other syntax formatting
-        for expression, nth, format in self.rules:
-            index = expression.indexIn(text, 0)
-
-            while index >= 0:
-                # We actually want the index of the nth match
-                index = expression.pos(nth)
-                cap = expression.cap(nth)
-                length = len(cap)
-                self.setFormat(index, length, format)
-                index = expression.indexIn(text, index + length)
+        if self.visible_blocks is not None:
+            first, last = self.visible_blocks()
+            if not first <= self.currentBlock().blockNumber() <= last:
+                self.setCurrentBlockState(-1)
+                return
+
+        for start, length, style in highlight_spans(text):
+            self.setFormat(start, length, STYLES[style])
 
         self.setCurrentBlockState(0)
 
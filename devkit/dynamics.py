@@ -0,0 +1,103 @@
+import numpy as np
+
+from world import World
+
+
+class ShipDynamics:
+    """ Motion of ships driven by their 8 thrusters, all ships at once.
+
+    Thruster layout is the one `helm.dasm` expects, in the ship frame
+    (x forward, y to the left):
+
+        0, 1: rear (left, right), push forward
+        2, 3: front (left, right), push backward
+        4, 5: left side (front, back), push right
+        6, 7: right side (front, back), push left
+
+    Per thruster force and torque are constant in the ship frame, so for
+    (ships, 8) power levels both are one matrix product. Bodies move the
+    objects of a `World`: positions and headings are integrated in place
+    (semi-implicit Euler).
+    """
+
+    # newtons at power 0xff
+    MAX_THRUST = 20000.0
+
+    # kilograms
+    MASS = 10000.0
+    # meters
+    LENGTH = 20.0
+    WIDTH = 10.0
+
+    # ship frame, in halves of length and width
+    THRUSTER_POSITIONS = np.array([
+        [-1, 1], [-1, -1],
+        [1, 1], [1, -1],
+        [1, 1], [-1, 1],
+        [1, -1], [-1, -1],
+    ], dtype=np.float64)
+
+    THRUSTER_DIRECTIONS = np.array([
+        [1, 0], [1, 0],
+        [-1, 0], [-1, 0],
+        [0, -1], [0, -1],
+        [0, 1], [0, 1],
+    ], dtype=np.float64)
+
+    def __init__(self, world: World):
+        self.world = world
+
+        # world object number of every body
+        self.numbers = np.zeros(0, dtype=np.intp)
+        self.velocities = np.zeros((0, 2), dtype=np.float64)
+        # radians per second
+        self.spins = np.zeros(0, dtype=np.float64)
+
+        self.masses = np.zeros(0, dtype=np.float64)
+        self.inertias = np.zeros(0, dtype=np.float64)
+
+        positions = self.THRUSTER_POSITIONS * (self.LENGTH / 2, self.WIDTH / 2)
+        # (8, 2) force and (8,) torque of every thruster at full power
+        self.forces = self.THRUSTER_DIRECTIONS * self.MAX_THRUST
+        self.torques = positions[:, 0] * self.forces[:, 1] - positions[:, 1] * self.forces[:, 0]
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __repr__(self):
+        return f'<ShipDynamics bodies: {len(self)}>'
+
+    def add(self, number, mass=MASS) -> int:
+        """ Make world object `number` a body, a box of LENGTH x WIDTH
+
+        :return: body index, row of `integrate` power levels
+        """
+        inertia = mass * (self.LENGTH ** 2 + self.WIDTH ** 2) / 12
+
+        self.numbers = np.append(self.numbers, number)
+        self.velocities = np.append(self.velocities, [[0.0, 0.0]], axis=0)
+        self.spins = np.append(self.spins, 0.0)
+        self.masses = np.append(self.masses, mass)
+        self.inertias = np.append(self.inertias, inertia)
+        return len(self) - 1
+
+    def integrate(self, power: np.ndarray, dt):
+        """ Advance all bodies by `dt` seconds
+
+        :param power: (bodies, 8) thruster power levels, 0..0xff
+        """
+        # (0, 8) for a fleet without ships, the products stay empty
+        levels = np.asarray(power, dtype=np.float64).reshape(-1, 8) / 0xff
+
+        local = levels @ self.forces
+        torque = levels @ self.torques
+
+        headings = self.world.headings[self.numbers]
+        cos, sin = np.cos(headings), np.sin(headings)
+        force = np.stack([local[:, 0] * cos - local[:, 1] * sin, local[:, 0] * sin + local[:, 1] * cos], axis=1)
+
+        self.velocities += force / self.masses[:, None] * dt
+        self.spins += torque / self.inertias * dt
+
+        self.world.positions[self.numbers] += self.velocities * dt
+        self.world.headings[self.numbers] = (headings + self.spins * dt) % (2 * np.pi)
@@ -1,27 +1,45 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 from PyQt5 import QtGui
-from PyQt5.QtCore import QPoint
+from PyQt5.QtCore import QPoint, pyqtSignal
 from PyQt5.QtGui import QKeySequence, QTextCursor
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QShortcut
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QShortcut, QMessageBox
 
 from devkit_code_editor import QCodeEditor, DCPUHighlighter
 
+# one thread keeps saves of a file in order
+_save_executor = ThreadPoolExecutor(max_workers=1)
+
 
 class EditorWindow(QWidget):
     """
     This "window" is a QWidget. If it has no parent, it
     will appear as a free-floating window as we want.
     """
-    def __init__(self, workdir, filename, click_cback):
+    # emitted in the GUI thread once file is written
+    saved = pyqtSignal(str)
+    # save thread -> GUI thread: (future of `_write`, saved text)
+    write_done = pyqtSignal(object, str)
+
+    def __init__(self, workdir, filename, click_cback, save_cback=None, references_cback=None,
+                 breakpoint_cback=None):
         super().__init__()
         self.layout = QVBoxLayout()
 
-        self.pc_to_line = {}
         self.hl = None
         self.highligh_pass = False
         self.filename = filename
         self.click_cback = click_cback
+        self.save_cback = save_cback
+        self.references_cback = references_cback
+        self.breakpoint_cback = breakpoint_cback
+        # (future, text) of the last submitted save
+        self.pending_save = None
+
+        if save_cback:
+            self.saved.connect(save_cback)
+        self.write_done.connect(self.finish_save)
 
         self.file_full = os.path.join(workdir, filename)
         self.code = self.setup_code_editor(self.file_full)
@@ -32,7 +50,7 @@ class EditorWindow(QWidget):
     def setup_code_editor(self, filename):
         """ Replaces basic text editor widget by custom code editor widget """
 
-        better_code = QCodeEditor(self, self.pc_to_line, True, self.click_cback)
+        better_code = QCodeEditor(self, self.click_cback, self.breakpoint_cback)
 
         font = QtGui.QFont()
         font.setFamily('Monospace')
@@ -44,23 +62,29 @@ class EditorWindow(QWidget):
         better_code.setTabStopWidth(30)
 
         with open(filename) as f:
-            for line in f.readlines():
-                better_code.appendPlainText(line.rstrip())
+            text = '\n'.join(line.rstrip() for line in f.read().splitlines())
+
+        # one bulk insert: a single layout pass instead of one per line
+        better_code.setPlainText(text)
 
         better_code.setEnabled(True)
 
         cursor = better_code.cursorForPosition(QPoint(0, 0))
         better_code.setTextCursor(cursor)
 
-        self.hl = DCPUHighlighter(better_code.document())
+        self.hl = DCPUHighlighter(better_code.document(), better_code.visible_blocks)
+        better_code.highlighter = self.hl
 
         shortcut = QShortcut(QKeySequence("Ctrl+S"), better_code)
         shortcut.activated.connect(self.save_file)
 
+        shortcut = QShortcut(QKeySequence("Shift+F12"), better_code)
+        shortcut.activated.connect(self.find_references)
+
         return better_code
 
     def closeEvent(self, event):
-        self.save_file()
+        self.save_file(wait=True)
 
     def select_line(self, selectline):
         cursor = QTextCursor(self.code.document().findBlockByLineNumber(selectline))
@@ -72,7 +96,47 @@ class EditorWindow(QWidget):
     def disable(self):
         self.code.setDisabled(True)
 
-    def save_file(self):
-        data = self.code.toPlainText()
+    def save_file(self, wait=False):
+        """ Writes the file in background, unmodified documents are skipped
+
+        :param wait: block until the file is on disk (e.g. before assembling)
+        """
+        if self.code.document().isModified():
+            data = self.code.toPlainText()
+            if self.pending_save is None or self.pending_save[1] != data:
+                future = _save_executor.submit(self._write, data)
+                self.pending_save = future, data
+                future.add_done_callback(lambda done: self.write_done.emit(done, data))
+
+        if wait and self.pending_save is not None:
+            self.pending_save[0].exception()
+            self.finish_save(*self.pending_save)
+
+    def _write(self, data):
         with open(self.file_full, 'w') as f:
             f.write(data)
+
+    def finish_save(self, future, data):
+        """ Document is marked saved only once the write succeeded and if
+            it was not edited meanwhile
+        """
+        if self.pending_save is None or self.pending_save[0] is not future:
+            # handled already or a newer save is on the way
+            return
+        self.pending_save = None
+
+        error = future.exception()
+        if error is not None:
+            QMessageBox.warning(self, 'Save Error', f'Can not save {self.filename}: {error}')
+            return
+
+        if self.code.toPlainText() == data:
+            self.code.document().setModified(False)
+
+        self.saved.emit(self.filename)
+
+    def find_references(self):
+        if self.references_cback:
+            cursor = self.code.textCursor()
+            cursor.select(QTextCursor.WordUnderCursor)
+            self.references_cback(cursor.selectedText())
@@ -1,11 +1,12 @@
 import argparse
+from array import array
 from functools import wraps
 
-from constants import BIN2REGISTERS
+from constants import BIN2REGISTERS, CYCLES
 from decoder import load_bin_file, to_human_readable, describe_instruction, DescribeException
 from hardware import (
     Display, Keyboard, RAM, Registers, Sensor, Thruster, Door,
-    DockingClamp, Antenna, Boot, Clock, Floppy, Laser,
+    DockingClamp, Antenna, RadioBus, Boot, Clock, Floppy, Laser,
 )
 from instuction import Operator, Instruction
 
@@ -46,8 +47,10 @@ def todo(func):
 class Emulator:
     """ DCPU-16 + hardware emulator """
 
-    def __init__(self, debug):
+    def __init__(self, debug, radio_bus: RadioBus = None):
+        """ :param radio_bus: shared with other emulators to let their antennas talk """
         self._debug = debug
+        self.radio_bus = radio_bus or RadioBus()
 
         self.ram = RAM()
 
@@ -56,20 +59,37 @@ class Emulator:
 
         self.on_interruption_now = False
 
+        # elapsed cycles, see `constants.CYCLES`
+        self.cycles = 0
+
+        # times the instruction at every PC was executed
+        self.exec_counts = array('I', [0]) * 0x10000
+
+        # `run_step` generator used by `run`
+        self._runner = None
+
         self.hardware = []
         self.hardware.extend([Thruster(self.regs, self.ram)])
         self.hardware.extend([Boot(self.regs, self.ram)])
         self.hardware.extend([Display(self.regs, self.ram), Keyboard(self.regs, self.ram)])
-        self.hardware.extend([Floppy(self.regs, self.ram)])
+        self.hardware.extend([Floppy(self.regs, self.ram, cycles=lambda: self.cycles)])
         self.hardware.extend([Sensor(self.regs, self.ram)])
         self.hardware.extend([Clock(self.regs, self.ram)])
         self.hardware.extend([Sensor(self.regs, self.ram)])
-        self.hardware.extend([Antenna(self.regs, self.ram)])
-        self.hardware.extend([Antenna(self.regs, self.ram)])
+        self.hardware.extend([Antenna(self.regs, self.ram, self.radio_bus)])
+        self.hardware.extend([Antenna(self.regs, self.ram, self.radio_bus)])
         self.hardware.extend([DockingClamp(self.regs, self.ram)])
         self.hardware.extend([Door(self.regs, self.ram)])
         self.hardware.extend([Laser(self.regs, self.ram)])
 
+        # devices which request interrupts, checked before every instruction
+        self._interrupt_sources = [
+            hw for hw in self.hardware
+            if hw.TYPE in ('keyboard', 'door', 'clock', 'antenna', 'docking_clamp', 'floppy')
+        ]
+        # devices with operations finishing at `deadline` cycle
+        self._timed_devices = [hw for hw in self.hardware if hasattr(hw, 'deadline')]
+
     def preload(self, filename):
         for pc, code in load_bin_file(filename):
             self.ram[pc] = code
@@ -79,19 +99,76 @@ class Emulator:
         for pc, instruction in self.gen_instructions_from_ram():
             yield pc, instruction.cmd == 'BRK'
 
-            if self._debug:
-                print(to_human_readable(instruction, pc))
+            self.execute(pc, instruction)
+
+    def step(self) -> bool:
+        """ Execute one instruction, without the generator of `run_step`
+
+        :return: False if the word at PC is not an instruction
+        """
+        self.process_hw_interruptions()
+
+        decoded = self.decode()
+        if decoded is None:
+            return False
+
+        self.execute(*decoded)
+        return True
+
+    def run_cycles(self, until) -> bool:
+        """ Execute instructions until `cycles` reaches `until`.
+
+        Batch stepping for emulators run side by side (see `fleet.Fleet`):
+        no generators, clocks are updated once per call, BRK does not stop.
+        Can not be mixed with `run` / `run_step` on the same emulator.
+
+        :return: False if the program ran out of instructions
+        """
+        if self._runner is not None:
+            raise RuntimeError('Emulator is driven by run()')
+
+        step = self.step
+        while self.cycles < until:
+            if not step():
+                return False
+
+        for clock in self.get_all_hardware_by_name('clock'):
+            clock.update()
+
+        return True
+
+    def run(self, steps, breakpoints=()):
+        """ Batch execution, continues where the previous call stopped.
+
+        Like `run_step`, every step executes the pending instruction and
+        decodes the next one, PC reported is the one about to be executed.
 
+        :param steps: max instructions to execute
+        :param breakpoints: stop before executing instruction at any of these PCs
+        :return: (executed steps, PC, stop reason: None, 'brk', 'break' or 'halt')
+        """
+        if self._runner is None:
+            self._runner = self.run_step()
+
+        clocks = self.get_all_hardware_by_name('clock')
+
+        pc = self.regs.PC
+        for step in range(1, steps + 1):
             try:
-                value_b = self.get_value_from_op(instruction.B, do_pop=False)
-                value_a = self.get_value_from_op(instruction.A, do_pop=True)
-            except Exception:
-                raise Exception(f'Inconsistent instruction: {instruction}')
+                pc, is_brk = next(self._runner)
+            except StopIteration:
+                self._runner = None
+                return step - 1, self.regs.PC, 'halt'
 
-            do_not_inc_pc = self.exec_instruction(instruction, value_b, value_a)
+            for clock in clocks:
+                clock.update()
 
-            if do_not_inc_pc is False:
-                self.regs.PC += 1
+            if is_brk:
+                return step, pc, 'brk'
+            if pc in breakpoints:
+                return step, pc, 'break'
+
+        return steps, pc, None
 
     def gen_instructions_from_ram(self):
         """ Generates `Instruction` objects from RAM, manipulates PC while
@@ -103,26 +180,59 @@ class Emulator:
         while True:
             self.process_hw_interruptions()
 
-            origin_pc = self.regs.PC
-            code = self.ram[self.regs.PC]
-
-            try:
-                cmd, op_b, op_a, nw_b, nw_a = describe_instruction(code)
-            except DescribeException:
+            decoded = self.decode()
+            if decoded is None:
                 break
 
-            # when decoding long instruction, "b is always handled
-            # by the processor after a"
+            yield decoded
+
+    def decode(self):
+        """ Decode instruction at PC, leaves PC at its last word
+
+        :return: (pc, `Instruction`) or None if the word is not an instruction
+        """
+        origin_pc = self.regs.PC
+        code = self.ram[self.regs.PC]
+
+        try:
+            cmd, op_b, op_a, nw_b, nw_a = describe_instruction(code)
+        except DescribeException:
+            return None
+
+        # when decoding long instruction, "b is always handled
+        # by the processor after a"
+
+        if nw_a is True:
+            self.regs.PC += 1
+            nw_a = self.ram[self.regs.PC]
+
+        if nw_b is True:
+            self.regs.PC += 1
+            nw_b = self.ram[self.regs.PC]
+
+        instruction = Instruction(code, cmd, op_b, nw_b, op_a, nw_a)
+        instruction.words = self.regs.PC - origin_pc + 1
 
-            if nw_a is True:
-                self.regs.PC += 1
-                nw_a = self.ram[self.regs.PC]
+        return origin_pc, instruction
 
-            if nw_b is True:
-                self.regs.PC += 1
-                nw_b = self.ram[self.regs.PC]
+    def execute(self, pc, instruction):
+        """ Execute decoded instruction, count its cycles and move PC past it """
+        self.exec_counts[pc] += 1
 
-            yield origin_pc, Instruction(code, cmd, op_b, nw_b, op_a, nw_a)
+        if self._debug:
+            print(to_human_readable(instruction, pc))
+
+        try:
+            value_b = self.get_value_from_op(instruction.B, do_pop=False)
+            value_a = self.get_value_from_op(instruction.A, do_pop=True)
+        except Exception:
+            raise Exception(f'Inconsistent instruction: {instruction}')
+
+        do_not_inc_pc = self.exec_instruction(instruction, value_b, value_a)
+        self.cycles += CYCLES.get(instruction.cmd, 1) + instruction.words - 1
+
+        if do_not_inc_pc is False:
+            self.regs.PC += 1
 
     def get_hardware_by_name(self, name):
         for hw in self.hardware:
@@ -140,12 +250,15 @@ class Emulator:
             must be queued.
         """
 
-        for hw in {'keyboard', 'door', 'clock', 'antenna', 'docking_clamp'}:
-            hardware = self.get_hardware_by_name(hw)
-            if not hardware:
-                return
+        for device in self._timed_devices:
+            if device.deadline is not None and self.cycles >= device.deadline:
+                device.update()
+
+        if self.on_interruption_now or self.regs.IA == 0:
+            return
 
-            if hardware.interruptions and self.on_interruption_now is False and self.regs.IA > 0:
+        for hardware in self._interrupt_sources:
+            if hardware.interruptions and self.on_interruption_now is False:
                 self.stack_push(self.regs.PC)
                 self.stack_push(self.regs.A)
 
@@ -380,7 +493,8 @@ class Emulator:
             return
 
         device = self.hardware[hwnum]
-        device.handle_interruption()
+        extra_cycles = device.handle_interruption()
+        self.cycles += device.INTERRUPT_CYCLES + (extra_cycles or 0)
 
     @instruction
     def brk(self, _, __,___):
@@ -398,6 +512,7 @@ class Emulator:
             skip += 1
 
         self.regs.PC += skip
+        self.cycles += 1
 
         if cmd.startswith('IF'):
             self.skip_next_instruction()
@@ -488,10 +603,14 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('filename')
     parser.add_argument('--debug', action='store_true', default=False)
+    parser.add_argument('--floppy', help='disk image to insert, 1440 sectors of 512 words')
+    parser.add_argument('--write-protected', action='store_true', default=False, help='insert the disk read only')
     args = parser.parse_args()
 
     e = Emulator(args.debug)
     e.preload(args.filename)
+    if args.floppy:
+        e.get_hardware_by_name('floppy').insert(args.floppy, args.write_protected)
     for step in e.run_step():
         if args.debug:
             print(e.regs)
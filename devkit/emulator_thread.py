@@ -0,0 +1,150 @@
+import queue
+import threading
+import time
+from collections import deque
+
+from emulator import Emulator
+from hardware import Registers
+from renderer import DisplayRenderer
+
+
+class Snapshot:
+    """ Emulator state published for the UI """
+
+    def __init__(self, regs, pc, cycles, running, stop=None, error=None, variables=None):
+        self.regs = regs
+        self.pc = pc
+        self.cycles = cycles
+        self.running = running
+        self.stop = stop
+        self.error = error
+        # {address: word} of watched RAM, see `EmulatorThread.set_variables`
+        self.variables = variables or {}
+
+    def __repr__(self):
+        return f'<Snapshot PC: 0x{self.pc:04x} cycles: {self.cycles} running: {self.running} stop: {self.stop}>'
+
+
+class EmulatorThread(threading.Thread):
+    """ Runs the emulator in batches away from the Qt event loop.
+
+    The UI talks to the thread only through queues: commands (and any
+    hardware access, see `call`) go into `commands`, the thread publishes
+    the latest `Snapshot` and display frames into one slot deques the UI
+    polls without locking. Stops (BRK, breakpoint, single step, errors) go
+    to `events` so the UI never misses one.
+
+    `speed` is instructions per millisecond, like the old 1 ms timer tick.
+    """
+
+    TICK = 0.001
+    FRAME_INTERVAL = 1 / 60
+
+    def __init__(self, emulator: Emulator, renderer: DisplayRenderer):
+        super().__init__(daemon=True)
+        self.emulator = emulator
+        self.renderer = renderer
+
+        self.commands = queue.SimpleQueue()
+        self.snapshots = deque(maxlen=1)
+        self.frames = deque(maxlen=1)
+        self.events = deque()
+
+        self.speed = 1
+        self.breakpoints = frozenset()
+        self.variables = ()
+        self.running = False
+        self._alive = True
+        self._last_pc = emulator.regs.PC
+
+    # UI side
+
+    def call(self, func, *args):
+        """ Run `func(*args)` in the emulator thread between batches """
+        self.commands.put((func, args))
+
+    def resume(self):
+        self.call(setattr, self, 'running', True)
+
+    def pause(self):
+        self.call(setattr, self, 'running', False)
+
+    def step(self):
+        self.call(self._step)
+
+    def set_speed(self, speed):
+        self.call(setattr, self, 'speed', speed)
+
+    def set_breakpoints(self, pcs):
+        self.call(setattr, self, 'breakpoints', frozenset(pcs))
+
+    def set_variables(self, addresses):
+        """ RAM words copied into every snapshot """
+        self.call(setattr, self, 'variables', tuple(addresses))
+
+    def stop(self):
+        self.call(setattr, self, '_alive', False)
+        self.join()
+
+    # emulator thread
+
+    def run(self):
+        next_frame = 0
+
+        while self._alive:
+            self._process_commands(block=not self.running)
+
+            if self.running:
+                started = time.perf_counter()
+                self._run_batch(self.speed)
+
+                rest = self.TICK - (time.perf_counter() - started)
+                if rest > 0:
+                    time.sleep(rest)
+
+            now = time.perf_counter()
+            if now >= next_frame or not self.running:
+                self._publish()
+                next_frame = now + self.FRAME_INTERVAL
+
+    def _process_commands(self, block):
+        try:
+            func, args = self.commands.get(block=block)
+            func(*args)
+
+            while True:
+                func, args = self.commands.get_nowait()
+                func(*args)
+        except queue.Empty:
+            pass
+
+    def _run_batch(self, steps):
+        """ :return: stop reason, see `Emulator.run` """
+        try:
+            _, self._last_pc, stop = self.emulator.run(steps, self.breakpoints)
+        except Exception as ex:
+            self.running = False
+            self.events.append(self._snapshot(stop='error', error=str(ex)))
+            return 'error'
+
+        if stop is not None:
+            self.running = False
+            self.events.append(self._snapshot(stop=stop))
+
+        return stop
+
+    def _step(self):
+        self.running = False
+        if self._run_batch(1) is None:
+            self.events.append(self._snapshot(stop='step'))
+
+    def _snapshot(self, stop=None, error=None):
+        regs = {reg: self.emulator.regs[reg] for reg in Registers.REGS}
+        variables = {address: self.emulator.ram[address] for address in self.variables}
+        return Snapshot(regs, self._last_pc, self.emulator.cycles, self.running, stop, error, variables)
+
+    def _publish(self):
+        self.snapshots.append(self._snapshot())
+
+        if self.renderer.update():
+            self.frames.append(self.renderer.frames.copy())
@@ -0,0 +1,210 @@
+from constants import REGISTERS
+from lexer import tokenize, number_value, char_value
+
+
+class ExpressionError(Exception):
+    pass
+
+
+class Value:
+    """ Assembly time value: const + sum(coeff * symbol)
+
+    Expressions are folded to this linear form. Symbols are labels and
+    constants which are not known yet, the linker substitutes them.
+    """
+
+    def __init__(self, const=0, terms=None):
+        self.const = const
+        self.terms = {symbol: coeff for symbol, coeff in (terms or {}).items() if coeff}
+
+    @property
+    def is_constant(self):
+        return not self.terms
+
+    @staticmethod
+    def of(value):
+        return value if isinstance(value, Value) else Value(value)
+
+    def __add__(self, other):
+        other = Value.of(other)
+        terms = dict(self.terms)
+        for symbol, coeff in other.terms.items():
+            terms[symbol] = terms.get(symbol, 0) + coeff
+        return Value(self.const + other.const, terms)
+
+    def __neg__(self):
+        return Value(-self.const, {symbol: -coeff for symbol, coeff in self.terms.items()})
+
+    def __sub__(self, other):
+        return self + -Value.of(other)
+
+    def scale(self, factor: int):
+        return Value(self.const * factor, {symbol: coeff * factor for symbol, coeff in self.terms.items()})
+
+    def substitute(self, symbols: dict):
+        """ Replace known symbols by their values (int or Value) """
+        result = Value(self.const)
+        for symbol, coeff in self.terms.items():
+            if symbol in symbols:
+                result = result + Value.of(symbols[symbol]).scale(coeff)
+            else:
+                result = result + Value(0, {symbol: coeff})
+        return result
+
+    def evaluate(self, symbols: dict) -> int:
+        """ :return: 16 bit word, all symbols must be known """
+        value = self.substitute(symbols)
+        if not value.is_constant:
+            raise ExpressionError(f'Unknown symbol: {", ".join(value.terms)}')
+        return value.const & 0xffff
+
+    def __eq__(self, other):
+        other = Value.of(other)
+        return self.const == other.const and self.terms == other.terms
+
+    def __repr__(self):
+        return f'<Value {self.const} {self.terms}>'
+
+
+def _constant_op(func, name):
+    def wrapper(left, right):
+        if not left.is_constant or not right.is_constant:
+            raise ExpressionError(f'Operator {name} requires constant operands')
+        return Value(func(left.const, right.const))
+    return wrapper
+
+
+def _div(a, b):
+    if b == 0:
+        raise ExpressionError('Division by zero')
+    return int(a / b)
+
+
+def _mod(a, b):
+    if b == 0:
+        raise ExpressionError('Division by zero')
+    return a % b
+
+
+def _mul(left, right):
+    if left.is_constant:
+        return right.scale(left.const)
+    if right.is_constant:
+        return left.scale(right.const)
+    raise ExpressionError('Operator * requires a constant operand')
+
+
+# binary operators from lowest to highest precedence
+BINARY_OPERATORS = [
+    {'|': _constant_op(lambda a, b: a | b, '|')},
+    {'^': _constant_op(lambda a, b: a ^ b, '^')},
+    {'&': _constant_op(lambda a, b: a & b, '&')},
+    {'<<': _constant_op(lambda a, b: a << b, '<<'), '>>': _constant_op(lambda a, b: a >> b, '>>')},
+    {'+': lambda a, b: a + b, '-': lambda a, b: a - b},
+    {'*': _mul, '/': _constant_op(_div, '/'), '%': _constant_op(_mod, '%')},
+]
+
+
+class _Parser:
+    """ Recursive descent parser over `lexer.tokenize` output """
+
+    def __init__(self, text, constants, allow_register):
+        self.tokens = list(tokenize(text))
+        self.pos = 0
+        self.constants = constants
+        self.allow_register = allow_register
+        self.register = None
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None, None
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise ExpressionError('Empty expression')
+
+        value = self.binary(0)
+        if self.pos != len(self.tokens):
+            raise ExpressionError(f'Unexpected token: {self.peek()[1]}')
+        return value
+
+    def binary(self, level):
+        if level == len(BINARY_OPERATORS):
+            return self.unary()
+
+        operators = BINARY_OPERATORS[level]
+        value = self.binary(level + 1)
+        while True:
+            kind, text = self.peek()
+            if kind != 'op' or text not in operators:
+                return value
+            self.take()
+            value = operators[text](value, self.binary(level + 1))
+
+    def unary(self):
+        kind, text = self.peek()
+        if kind == 'op' and text in ('-', '+', '~'):
+            self.take()
+            value = self.unary()
+            if text == '-':
+                return -value
+            if text == '~':
+                return _constant_op(lambda a, _: ~a, '~')(value, Value())
+            return value
+
+        return self.primary()
+
+    def primary(self):
+        kind, text = self.take()
+
+        if kind == 'number':
+            return Value(number_value(text))
+        if kind == 'char':
+            return Value(char_value(text))
+        if kind == 'op' and text == '(':
+            value = self.binary(0)
+            if self.take() != ('op', ')'):
+                raise ExpressionError('Missing )')
+            return value
+        if kind == 'symbol':
+            if text in REGISTERS:
+                return self.register_term(text)
+            if text in self.constants:
+                return Value.of(self.constants[text])
+            return Value(0, {text: 1})
+
+        raise ExpressionError(f'Unexpected token: {text}' if text else 'Unexpected end of expression')
+
+    def register_term(self, register):
+        """ Register may appear once, as a plain `+` term of pointer expression """
+        if not self.allow_register or self.register is not None:
+            raise ExpressionError(f'Unexpected register: {register}')
+
+        prev_kind, prev_text = self.tokens[self.pos - 2] if self.pos >= 2 else (None, None)
+        next_kind, next_text = self.peek()
+        if prev_kind is not None and (prev_kind, prev_text) != ('op', '+'):
+            raise ExpressionError(f'Register {register} must be added to the expression')
+        if next_kind is not None and (next_kind, next_text) not in (('op', '+'), ('op', '-')):
+            raise ExpressionError(f'Register {register} must be added to the expression')
+
+        self.register = register
+        return Value()
+
+
+def parse_expression(text: str, constants: dict = None, allow_register=False):
+    """ Parse and fold operand expression.
+
+    :param text: expression, like `label+2`, `SIZE*2` or `A + 0x10`
+    :param constants: known constants: name -> int or Value
+    :param allow_register: accept one register term (pointer operands)
+    :return: Value, register name or None
+    """
+    parser = _Parser(text, constants or {}, allow_register)
+    value = parser.parse()
+    return value, parser.register
@@ -0,0 +1,189 @@
+import argparse
+import math
+import time
+
+from constants import CPU_FREQUENCY
+from dynamics import ShipDynamics
+from emulator import Emulator
+from hardware import RadioBus, DockingClamp
+from world import World
+
+
+class Ship:
+    """ Emulator of one ship, its position is object `number` of the world """
+
+    def __init__(self, name, emulator: Emulator, world: World, number):
+        self.name = name
+        self.emulator = emulator
+        self.world = world
+        self.number = number
+        self.thruster = emulator.get_hardware_by_name('thruster')
+
+        self.halted = False
+        self.error = None
+
+    @property
+    def x(self):
+        return self.world.positions[self.number, 0]
+
+    @property
+    def y(self):
+        return self.world.positions[self.number, 1]
+
+    @property
+    def heading(self):
+        return self.world.headings[self.number]
+
+    def __repr__(self):
+        return f'<Ship {self.name} ({self.x:.0f}, {self.y:.0f}) cycles: {self.emulator.cycles} halted: {self.halted}>'
+
+
+class Fleet:
+    """ Many ships simulated in one process.
+
+    Ships run in lockstep: every `step` lets each ship execute the same
+    slice of emulated cycles (`Emulator.run_cycles`, one tight loop per
+    ship), then the shared world is updated between slices: thrusters
+    move the ships (`ShipDynamics`), antennas of all ships share one
+    `RadioBus`, sensors scan the `World` (ships and any other objects
+    added to it), docked clamps are released once a side switches its
+    clamp off.
+    """
+
+    # 10 ms of emulated time
+    SLICE_CYCLES = CPU_FREQUENCY // 100
+
+    # spec names no ship type, ships show up as structures
+    SHIP_TYPE = 0x03
+
+    def __init__(self, slice_cycles=SLICE_CYCLES, world: World = None):
+        self.slice_cycles = slice_cycles
+        self.radio_bus = RadioBus()
+        self.world = world or World()
+        self.dynamics = ShipDynamics(self.world)
+        self.ships = []
+        # (ship, clamp, ship, clamp)
+        self.docked = []
+        # emulated cycles every ship has reached
+        self.cycles = 0
+
+    def __repr__(self):
+        return f'<Fleet ships: {len(self.ships)} cycles: {self.cycles}>'
+
+    def add_ship(self, name, program=None, x=0.0, y=0.0, heading=0.0, size=20) -> Ship:
+        """
+        :param program: .bin file to preload
+        :param x, y: meters
+        :param heading: radians
+        :param size: diameter in meters, as seen by sensors
+        """
+        emulator = Emulator(debug=False, radio_bus=self.radio_bus)
+        emulator.cycles = self.cycles
+        if program:
+            emulator.preload(program)
+
+        number = self.world.add(self.SHIP_TYPE, len(self.ships), size, x, y, heading)
+        self.dynamics.add(number)
+        ship = Ship(name, emulator, self.world, number)
+        self.ships.append(ship)
+        return ship
+
+    def step(self):
+        """ Run one slice on every ship, then update the world """
+        until = self.cycles + self.slice_cycles
+
+        for ship in self.ships:
+            if ship.halted:
+                continue
+
+            try:
+                if not ship.emulator.run_cycles(until):
+                    ship.halted = True
+            except Exception as ex:
+                # emulator reports CPU faults as plain exceptions
+                ship.halted = True
+                ship.error = str(ex)
+
+        self.cycles = until
+        self.update_world()
+
+    def run(self, slices):
+        for _ in range(slices):
+            self.step()
+
+    def update_world(self):
+        self.update_motion()
+        self.update_sensors()
+        self.update_clamps()
+
+    def update_motion(self):
+        """ Thrust set during the slice acts for the whole slice """
+        power = [ship.thruster.power for ship in self.ships]
+        self.dynamics.integrate(power, self.slice_cycles / CPU_FREQUENCY)
+
+    def update_sensors(self):
+        self.world.build_index()
+
+        for ship in self.ships:
+            x, y, heading = ship.x, ship.y, ship.heading
+            for sensor in ship.emulator.get_all_hardware_by_name('sensor'):
+                sensor.update_sensor(self.world.scan(x, y, heading, sensor.range, exclude=ship.number))
+
+    def dock(self, ship: Ship, clamp, other: Ship, other_clamp) -> bool:
+        """ Connect clamps of two ships, both programs get a state change interrupt
+
+        :return: False if one of the clamps is switched off
+        """
+        clamps = ship.emulator.get_hardware_by_name('docking_clamp')
+        other_clamps = other.emulator.get_hardware_by_name('docking_clamp')
+        if DockingClamp.Modes.OFF in (clamps.mode[clamp], other_clamps.mode[other_clamp]):
+            return False
+
+        clamps.change_state(clamp, DockingClamp.States.DOCKED)
+        other_clamps.change_state(other_clamp, DockingClamp.States.DOCKED)
+        self.docked.append((ship, clamp, other, other_clamp))
+        return True
+
+    def update_clamps(self):
+        """ Release docked pairs where a program switched its clamp off """
+        docked = []
+        for ship, clamp, other, other_clamp in self.docked:
+            clamps = ship.emulator.get_hardware_by_name('docking_clamp')
+            other_clamps = other.emulator.get_hardware_by_name('docking_clamp')
+
+            if DockingClamp.Modes.OFF in (clamps.mode[clamp], other_clamps.mode[other_clamp]):
+                clamps.change_state(clamp, DockingClamp.States.DEFAULT)
+                other_clamps.change_state(other_clamp, DockingClamp.States.DEFAULT)
+            else:
+                docked.append((ship, clamp, other, other_clamp))
+
+        self.docked = docked
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filename', nargs='+', help='.bin programs, assigned to ships in turn')
+    parser.add_argument('--ships', type=int, default=100)
+    parser.add_argument('--slices', type=int, default=100)
+    parser.add_argument('--spacing', type=float, default=500, help='meters between ships on the grid')
+    args = parser.parse_args()
+
+    fleet = Fleet()
+    side = math.ceil(math.sqrt(args.ships))
+    for num in range(args.ships):
+        fleet.add_ship(
+            f'ship{num}', args.filename[num % len(args.filename)],
+            x=(num % side) * args.spacing, y=(num // side) * args.spacing,
+        )
+
+    started = time.perf_counter()
+    fleet.run(args.slices)
+    elapsed = time.perf_counter() - started
+
+    instructions = sum(sum(ship.emulator.exec_counts) for ship in fleet.ships)
+    halted = [ship for ship in fleet.ships if ship.halted]
+    print(f'{len(fleet.ships)} ships, {fleet.cycles} cycles each ({fleet.cycles / CPU_FREQUENCY:.2f} s emulated)')
+    print(f'{instructions} instructions in {elapsed:.2f} s, {instructions / elapsed:.0f} per second')
+    print(f'radio: {fleet.radio_bus.sent} sent, {fleet.radio_bus.delivered} delivered, {fleet.radio_bus.dropped} dropped')
+    for ship in halted:
+        print(f'{ship.name} halted at PC 0x{ship.emulator.regs.PC:04x}: {ship.error or "no more instructions"}')
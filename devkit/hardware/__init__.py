@@ -6,7 +6,7 @@ from hardware.sensor import Sensor
 from hardware.thruster import Thruster
 from hardware.door import Door
 from hardware.docking_clamp import DockingClamp
-from hardware.antenna import Antenna
+from hardware.antenna import Antenna, RadioBus
 from hardware.boot import Boot
 from hardware.clock import Clock
 from hardware.floppy import Floppy
@@ -22,6 +22,7 @@ __all__ = [
     'Door',
     'DockingClamp',
     'Antenna',
+    'RadioBus',
     'Boot',
     'Clock',
     'Floppy',
@@ -1,9 +1,56 @@
-from collections import defaultdict
+from collections import deque
 
 from hardware import Registers, RAM
 from hardware.common import Hardware
 
 
+class RadioBus:
+    """ Radio traffic between antennas, of one or several emulators.
+
+    Antennas listen on their current channel. A message sent on a channel
+    is delivered to every other antenna tuned to it, the words are shared
+    by all receivers as a tuple. Listeners are kept per channel, so
+    sending costs only as much as there are receivers.
+    """
+
+    def __init__(self):
+        # channel -> (antenna, ...)
+        self._listeners = {}
+
+        self.sent = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def __repr__(self):
+        return f'<RadioBus channels: {len(self._listeners)} sent: {self.sent} dropped: {self.dropped}>'
+
+    def tune(self, antenna: 'Antenna', old_channel, new_channel):
+        """ Move antenna between channels, `old_channel` None for a new one """
+        self._remove(antenna, old_channel)
+        self._listeners[new_channel] = self._listeners.get(new_channel, ()) + (antenna,)
+
+    def detach(self, antenna: 'Antenna'):
+        self._remove(antenna, antenna.channel)
+
+    def _remove(self, antenna, channel):
+        listeners = tuple(a for a in self._listeners.get(channel, ()) if a is not antenna)
+        if listeners:
+            self._listeners[channel] = listeners
+        else:
+            self._listeners.pop(channel, None)
+
+    def send(self, sender: 'Antenna', channel, words: tuple):
+        self.sent += 1
+        for antenna in self._listeners.get(channel, ()):
+            if antenna is sender:
+                continue
+
+            if antenna.recv_message(words):
+                self.delivered += 1
+            else:
+                self.dropped += 1
+
+
 class Antenna(Hardware):
     """
         Antenna
@@ -44,57 +91,97 @@ class Antenna(Hardware):
     VENDOR = 0x54482b2b
     TYPE = 'antenna'
 
-    def __init__(self, regs: Registers, ram: RAM):
+    MAX_MESSAGE_WORDS = 256
+
+    # messages the receive buffer holds, new ones are dropped when it is full
+    RECV_BUFFER_SIZE = 64
+    # recently sent messages, shown in the UI
+    SEND_LOG_SIZE = 8
+
+    def __init__(self, regs: Registers, ram: RAM, bus: RadioBus = None):
         super().__init__(regs, ram)
-        # TODO: a variable amount of clams
 
+        self.bus = bus or RadioBus()
         self.channel = 0
-        self.send_buffer = defaultdict(list)
-        self.recv_buffer = defaultdict(list)
+        self.bus.tune(self, None, self.channel)
+
+        self.send_buffer = deque(maxlen=self.SEND_LOG_SIZE)
+        self.recv_buffer = deque()
 
         self.irq_enabled = False
         self.irq_code = None
         self.interruptions = []
 
+    def __repr__(self):
+        return f'<Antenna channel: 0x{self.channel:08x} received: {len(self.recv_buffer)}>'
+
     def handle_interruption(self):
+        """ :return: cycles of sending or receiving, one per word """
         code = self.regs.A
         if code == 0:
             self.irq_code = self.regs.B
             self.irq_enabled = bool(self.irq_code != 0)
         elif code == 1:
-            self.channel = (self.regs.B << 16) & self.regs.C
+            self.set_channel((self.regs.B << 16) | self.regs.C)
         elif code == 2:
             self.regs.B = self.channel >> 16
             self.regs.C = self.channel & 0xffff
         elif code == 3:
-            words = min(256, self.regs.I)
+            words = self.regs.I
+            if not 1 <= words <= self.MAX_MESSAGE_WORDS:
+                print(f'[{self.TYPE}] Bad message length: {words}')
+                return 0
+
+            start = self.regs.B
+            msg = tuple(self.ram[(start + i) & 0xffff] for i in range(words))
 
-            # self.send_buffer[self.channel].append(self.ram[self.regs.B + i] for i in range(words))
-            self.recv_message([self.ram[self.regs.B + i] for i in range(words)])
+            self.send_buffer.append(msg)
+            self.changed()
+            self.bus.send(self, self.channel, msg)
+
+            return words
         elif code == 4:
-            if not self.recv_buffer[self.channel]:
+            if not self.recv_buffer:
                 self.regs.I = 0
                 self.regs.X = 0
                 self.regs.Y = 0
 
-                return
+                return 0
 
-            msg = self.recv_buffer[self.channel].pop()
+            msg = self.recv_buffer.popleft()
+            self.changed()
             self.regs.I = len(msg)
             self.regs.X = 0x0001
             self.regs.Y = 0x0001
 
+            start = self.regs.B
             for i, word in enumerate(msg):
-                self.ram[self.regs.B + i] = word
+                self.ram[(start + i) & 0xffff] = word
 
+            return len(msg)
         elif code == 5:
-            self.recv_buffer[self.channel] = []
+            self.recv_buffer.clear()
+            self.changed()
         else:
             print(f'[{self.TYPE}] Unexpected interruption code: {code}')
 
-    def recv_message(self, data):
-        assert isinstance(data, list)
-        self.recv_buffer[self.channel].append(data)
+    def set_channel(self, channel):
+        self.bus.tune(self, self.channel, channel)
+        self.channel = channel
+
+    def recv_message(self, data) -> bool:
+        """ Put message into the receive buffer
+
+        :return: False if the buffer is full and the message is dropped
+        """
+        if len(self.recv_buffer) >= self.RECV_BUFFER_SIZE:
+            return False
+
+        self.recv_buffer.append(tuple(data[:self.MAX_MESSAGE_WORDS]))
+        self.changed()
 
-        if self.irq_enabled:
+        # one pending interrupt covers all messages received meanwhile
+        if self.irq_enabled and self.irq_code not in self.interruptions:
             self.interruptions.append(self.irq_code)
+
+        return True
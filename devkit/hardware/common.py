@@ -7,9 +7,20 @@ class Hardware(ABC):
     VENDOR = None
     TYPE = None
 
+    # cycles HWI takes on top of its base cost
+    INTERRUPT_CYCLES = 0
+
     def __init__(self, regs: 'Registers', ram: 'RAM'):
         self.regs = regs
         self.ram = ram
 
+        # bumped on every change of the state shown in the UI, so it can
+        # skip devices which did not change since it looked last time
+        self.version = 0
+
+    def changed(self):
+        self.version += 1
+
     def handle_interruption(self):
+        """ May return cycles the operation takes on top of `INTERRUPT_CYCLES` """
         raise NotImplemented
@@ -11,6 +11,10 @@ class Display(Hardware):
     VENDOR = 0x1c6c8b36
     TYPE = 'display'
 
+    SCREEN_WORDS = 32 * 12
+    FONT_WORDS = 128 * 2
+    PALETTE_WORDS = 16
+
     def __init__(self, regs: 'Registers', ram: 'RAM'):
         super().__init__(regs, ram)
         self.video_ram = 0
@@ -18,16 +22,24 @@ class Display(Hardware):
         self.palette_ram = 0
         self.border_color = 0
 
+        self._vram_watch = ram.watch(self.video_ram, self.SCREEN_WORDS)
+        self._font_watch = None
+        self._palette_watch = None
+        self._remapped = True
+
     def handle_interruption(self):
         code = self.regs.A
 
         if code == 0:
             self.video_ram = self.regs.B
+            self._vram_watch = self._rewatch(self._vram_watch, self.video_ram, self.SCREEN_WORDS)
         elif code == 1:
             self.font_ram = self.regs.B
-            # self.get_char.cache_clear()
+            self._font_watch = self._rewatch(self._font_watch, self.font_ram, self.FONT_WORDS, builtin=True)
         elif code == 2:
             self.palette_ram = self.regs.B
+            self._palette_watch = self._rewatch(self._palette_watch, self.palette_ram, self.PALETTE_WORDS,
+                                                builtin=True)
             self.load_palette.cache_clear()
         elif code == 3:
             self.border_color = self.regs.B & 0xf
@@ -40,6 +52,43 @@ class Display(Hardware):
         else:
             print(f'[{self.TYPE}] Unexpected interruption code: {code}')
 
+    def _rewatch(self, watch, start, size, builtin=False):
+        """ Moves RAM watch to a new mapping
+
+        :param builtin: address 0 maps built-in data, nothing to watch
+        """
+        if watch is not None:
+            watch.close()
+        self._remapped = True
+
+        if builtin and start == 0:
+            return None
+        return self.ram.watch(start, size)
+
+    def take_changes(self):
+        """ What was written to the mapped memory since the last call
+
+        :return: (cells, glyphs, colors) sets of indexes or None if the whole
+            screen must be redrawn (first call or memory was remapped)
+        """
+        watches = [w for w in (self._vram_watch, self._font_watch, self._palette_watch) if w is not None]
+
+        if self._remapped:
+            self._remapped = False
+            for watch in watches:
+                watch.take()
+            self.load_palette.cache_clear()
+            return None
+
+        cells = self._vram_watch.take()
+        glyphs = {offset >> 1 for offset in self._font_watch.take()} if self._font_watch else set()
+        colors = self._palette_watch.take() if self._palette_watch else set()
+
+        if colors:
+            self.load_palette.cache_clear()
+
+        return cells, glyphs, colors
+
     @lru_cache
     def load_palette(self, rgbfunc):
         """ Convert palette memory to actual colors using rgbfunc """
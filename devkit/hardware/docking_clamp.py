@@ -23,6 +23,8 @@ class DockingClamp(Hardware):
     class States(Enum):
         # TODO: find out
         DEFAULT = 0
+        # clamp holds a clamp of another ship, see `fleet.Fleet.dock`
+        DOCKED = 1
 
     def __init__(self, regs: Registers, ram: RAM):
         super().__init__(regs, ram)
@@ -46,6 +48,7 @@ class DockingClamp(Hardware):
             if clamp > 4:
                 return
             self.mode[clamp] = DockingClamp.Modes(self.regs.B)
+            self.changed()
         elif code == 2:
             self.irq_code = self.regs.B
             self.irq_enabled = bool(self.irq_code != 0)
@@ -57,6 +60,7 @@ class DockingClamp(Hardware):
             return
 
         self.state[clamp] = state
+        self.changed()
         if self.irq_enabled:
             self.interruptions.append(self.irq_code)
 
@@ -65,4 +69,5 @@ class DockingClamp(Hardware):
             return
 
         self.mode[clamp] = mode
+        self.changed()
 
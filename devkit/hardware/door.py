@@ -81,6 +81,7 @@ class Door(Hardware):
             if door > 3:
                 return
             self.mode[door] = self.Modes(self.regs.B)
+            self.changed()
         elif code == 2:
             self.irq_code = self.regs.B
             self.irq_enabled = bool(self.irq_code != 0)
@@ -92,6 +93,7 @@ class Door(Hardware):
             return
 
         self.state[door] = state
+        self.changed()
         if self.irq_enabled:
             self.interruptions.append(self.irq_code)
 
@@ -100,4 +102,5 @@ class Door(Hardware):
             return
 
         self.mode[door] = mode
+        self.changed()
 
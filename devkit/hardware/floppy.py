@@ -1,15 +1,216 @@
+import mmap
+import sys
+from array import array
+from enum import Enum
+
+from constants import CPU_FREQUENCY
 from hardware.common import Hardware
 from hardware import Registers, RAM
 
 
 class Floppy(Hardware):
+    """
+        Mackapar 3.5" Floppy Drive (M35FD)
+        ==================================
+
+        Hardware-ID    : 0x4fd524c5
+        Version        : 0x0001
+
+        Disks hold 1440 sectors (80 tracks, 18 sectors each) of 512 words.
+
+        A  | Function
+        ===+===============================================================
+        0  | Poll device. Sets B to the current state (see below) and C
+           | to the last error since the last device poll.
+        ---+---------------------------------------------------------------
+        1  | Set interrupt. Enables interrupts and sets the message to X
+           | if X is anything other than 0, disables interrupts if X is 0.
+           | When interrupts are enabled, the drive will trigger an
+           | interrupt whenever state or error changes.
+        ---+---------------------------------------------------------------
+        2  | Read sector. Reads sector X to DCPU ram starting at Y.
+           | Sets B to 1 if reading is possible and has been started,
+           | anything else if it fails. Reading is only possible if the
+           | state is READY or READY_WP.
+        ---+---------------------------------------------------------------
+        3  | Write sector. Writes sector X from DCPU ram starting at Y.
+           | Sets B to 1 if writing is possible and has been started,
+           | anything else if it fails. Writing is only possible if the
+           | state is READY.
+        ---+---------------------------------------------------------------
+
+        Seeking takes 2.4 ms per track, transfer runs at 30700 words per
+        second. Here both are counted in emulated cycles: the operation
+        finishes (data is copied, state goes back to ready) before the
+        first instruction at or past its deadline, see `update`.
+
+        The disk is an image file mapped into memory, 1440 * 512 little
+        endian words, see `insert`.
+    """
+
     ID = 0x4FD524C5
     VERSION = 0x0001
     VENDOR = 0x54482B2B
     TYPE = 'floppy'
 
-    def __init__(self, regs: Registers, ram: RAM):
+    SECTOR_WORDS = 512
+    SECTORS_PER_TRACK = 18
+    SECTORS = 80 * SECTORS_PER_TRACK
+    IMAGE_BYTES = SECTORS * SECTOR_WORDS * 2
+
+    # emulated cycles per track of seeking and per sector of transfer
+    SEEK_CYCLES = CPU_FREQUENCY * 24 // 10000
+    TRANSFER_CYCLES = CPU_FREQUENCY * SECTOR_WORDS // 30700
+
+    class States(Enum):
+        NO_MEDIA = 0x0000
+        READY = 0x0001
+        READY_WP = 0x0002
+        BUSY = 0x0003
+
+    class Errors(Enum):
+        NONE = 0x0000
+        BUSY = 0x0001
+        NO_MEDIA = 0x0002
+        PROTECTED = 0x0003
+        EJECT = 0x0004
+        BAD_SECTOR = 0x0005
+        BROKEN = 0xffff
+
+    def __init__(self, regs: Registers, ram: RAM, cycles=None,
+                 seek_cycles=SEEK_CYCLES, transfer_cycles=TRANSFER_CYCLES):
+        """ :param cycles: callable returning emulated cycles so far (`Emulator.cycles`) """
         super().__init__(regs, ram)
+        self.cycles = cycles or (lambda: 0)
+        self.seek_cycles = seek_cycles
+        self.transfer_cycles = transfer_cycles
+
+        self.state = Floppy.States.NO_MEDIA
+        self.error = Floppy.Errors.NONE
+        self.image = None
+        self.write_protected = False
+        self.track = 0
+
+        # cycle the running operation finishes at, None when idle
+        self.deadline = None
+        # (write, sector, address)
+        self.operation = None
+
+        self.irq_enabled = False
+        self.irq_code = None
+        self.interruptions = []
+
+    def __repr__(self):
+        return f'<Floppy {self.state.name} error: {self.error.name} track: {self.track}>'
 
     def handle_interruption(self):
-        print('Floopy device not implemented')
+        code = self.regs.A
+        if code == 0:
+            self.regs.B = self.state.value
+            self.regs.C = self.error.value
+            self.error = Floppy.Errors.NONE
+        elif code == 1:
+            self.irq_code = self.regs.X
+            self.irq_enabled = bool(self.irq_code != 0)
+        elif code == 2:
+            self.regs.B = int(self.start(False, self.regs.X, self.regs.Y))
+        elif code == 3:
+            self.regs.B = int(self.start(True, self.regs.X, self.regs.Y))
+        else:
+            print(f'[{self.TYPE}] Unexpected interruption code: {code}')
+
+    def insert(self, filename, write_protected=False):
+        """ Map disk image file, a shorter writable file is extended with zeros,
+            a shorter write protected one reads as zeros past its end
+        """
+        self.eject()
+
+        with open(filename, 'rb' if write_protected else 'r+b') as f:
+            f.seek(0, 2)
+            if not write_protected and f.tell() < self.IMAGE_BYTES:
+                f.truncate(self.IMAGE_BYTES)
+
+            if f.tell() == 0 and write_protected:
+                # empty files can not be mapped, the disk is blank
+                self.image = b''
+            else:
+                access = mmap.ACCESS_READ if write_protected else mmap.ACCESS_WRITE
+                self.image = mmap.mmap(f.fileno(), 0, access=access)
+
+        self.write_protected = write_protected
+        self.set_state(Floppy.States.READY_WP if write_protected else Floppy.States.READY)
+
+    def eject(self):
+        if self.image is None:
+            return
+
+        if self.state is Floppy.States.BUSY:
+            self.deadline = None
+            self.operation = None
+            self.set_error(Floppy.Errors.EJECT)
+
+        if isinstance(self.image, mmap.mmap):
+            self.image.close()
+        self.image = None
+        self.set_state(Floppy.States.NO_MEDIA)
+
+    def start(self, write, sector, address) -> bool:
+        if self.state is Floppy.States.NO_MEDIA:
+            return self.set_error(Floppy.Errors.NO_MEDIA)
+        if self.state is Floppy.States.BUSY:
+            return self.set_error(Floppy.Errors.BUSY)
+        if sector >= self.SECTORS:
+            return self.set_error(Floppy.Errors.BAD_SECTOR)
+        if write and self.write_protected:
+            return self.set_error(Floppy.Errors.PROTECTED)
+
+        track = sector // self.SECTORS_PER_TRACK
+        latency = abs(track - self.track) * self.seek_cycles + self.transfer_cycles
+        self.track = track
+
+        self.operation = write, sector, address
+        self.deadline = self.cycles() + latency
+        self.set_state(Floppy.States.BUSY)
+        return True
+
+    def update(self):
+        """ Finish the running operation, called once its deadline passed """
+        write, sector, address = self.operation
+        self.operation = None
+        self.deadline = None
+
+        offset = sector * self.SECTOR_WORDS * 2
+        size = self.SECTOR_WORDS * 2
+
+        if write:
+            data = array('H', self.ram.read_block(address, self.SECTOR_WORDS))
+            if sys.byteorder != 'little':
+                data.byteswap()
+            self.image[offset:offset + size] = data.tobytes()
+        else:
+            # write protected images may be shorter, the rest reads as zeros
+            raw = self.image[offset:offset + size]
+            data = array('H', raw + bytes(size - len(raw)))
+            if sys.byteorder != 'little':
+                data.byteswap()
+            self.ram.write_block(address, data)
+
+        self.set_state(Floppy.States.READY_WP if self.write_protected else Floppy.States.READY)
+
+    def set_state(self, state):
+        if state is not self.state:
+            self.state = state
+            self.changed()
+            self.interrupt()
+
+    def set_error(self, error) -> bool:
+        """ :return: False, result of the failed operation """
+        if error is not self.error:
+            self.error = error
+            self.interrupt()
+
+        return False
+
+    def interrupt(self):
+        if self.irq_enabled and self.irq_code not in self.interruptions:
+            self.interruptions.append(self.irq_code)
@@ -21,10 +21,12 @@ class Keyboard(Hardware):
         code = self.regs.A
         if code == 0:
             self.buffer = []
+            self.changed()
         elif code == 1:
             if self.buffer:
                 self.regs.C = self.buffer[0]
                 self.buffer = self.buffer[1:]
+                self.changed()
             else:
                 self.regs.C = 0
         elif code == 2:
@@ -51,6 +53,7 @@ class Keyboard(Hardware):
         if pressed:
             self.buffer.append(key)
             self.pressed_keys.add(key)
+            self.changed()
         else:
             if key in self.pressed_keys:
                 self.pressed_keys.remove(key)
@@ -1,15 +1,105 @@
 from collections import defaultdict
 
 
+class RAMWatch:
+    """ Collects offsets of written words inside a RAM range """
+
+    def __init__(self, ram: 'RAM', start, size):
+        self.ram = ram
+        self.start = start & 0xffff
+        self.size = size
+        self.dirty = set()
+
+    def __repr__(self):
+        return f'<RAMWatch 0x{self.start:04x}+{self.size} dirty: {len(self.dirty)}>'
+
+    def touch(self, address):
+        offset = (address - self.start) & 0xffff
+        if offset < self.size:
+            self.dirty.add(offset)
+
+    def take(self) -> set:
+        """ :return: offsets written since the last call """
+        dirty, self.dirty = self.dirty, set()
+        return dirty
+
+    def close(self):
+        self.ram.unwatch(self)
+
+
 class RAM:
+    """ 64K words of memory.
+
+    Devices can `watch` a range to learn which words were written. Watches
+    are indexed by page, so a write costs one list lookup unless it hits a
+    watched page.
+    """
+
+    # __setitem__ inlines these
+    PAGE_BITS = 6
+    PAGES = 0x10000 >> PAGE_BITS
+
     def __init__(self):
         self._ram = defaultdict(lambda: 0)
+        self._pages = [()] * self.PAGES
 
     def __getitem__(self, item):
         if isinstance(item, slice):
-            return [self[i] for i in range(*item.indices(len(self._ram)))]
+            return [self[i] for i in range(*item.indices(0x10000))]
 
         return self._ram[item]
 
     def __setitem__(self, key, value):
         self._ram[key] = value
+
+        watches = self._pages[(key >> 6) & 0x3ff]
+        if watches:
+            for watch in watches:
+                watch.touch(key)
+
+    def read_block(self, start, size) -> list:
+        """ `size` words from `start` (wraps around 0xffff) """
+        ram = self._ram
+        return [ram.get((start + offset) & 0xffff, 0) for offset in range(size)]
+
+    def write_block(self, start, words):
+        """ Store words from `start` (wraps around 0xffff), watches see
+            every written address like with single writes
+        """
+        start &= 0xffff
+        end = start + len(words)
+        if end > 0x10000:
+            split = 0x10000 - start
+            self.write_block(start, words[:split])
+            self.write_block(0, words[split:])
+            return
+
+        self._ram.update(zip(range(start, end), words))
+
+        for page in range(start >> self.PAGE_BITS, ((end - 1) >> self.PAGE_BITS) + 1):
+            watches = self._pages[page]
+            if not watches:
+                continue
+
+            first = max(start, page << self.PAGE_BITS)
+            last = min(end, (page + 1) << self.PAGE_BITS)
+            for watch in watches:
+                for address in range(first, last):
+                    watch.touch(address)
+
+    def _watch_pages(self, watch):
+        first = watch.start >> self.PAGE_BITS
+        last = (watch.start + max(watch.size, 1) - 1) >> self.PAGE_BITS
+        return [page & (self.PAGES - 1) for page in range(first, last + 1)]
+
+    def watch(self, start, size) -> RAMWatch:
+        """ Track writes to `size` words from `start` (wraps around 0xffff) """
+        watch = RAMWatch(self, start, size)
+        for page in self._watch_pages(watch):
+            self._pages[page] = self._pages[page] + (watch,)
+
+        return watch
+
+    def unwatch(self, watch: RAMWatch):
+        for page in self._watch_pages(watch):
+            self._pages[page] = tuple(w for w in self._pages[page] if w is not watch)
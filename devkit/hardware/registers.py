@@ -3,6 +3,8 @@ from collections import defaultdict
 
 class Registers:
     REGS = ['A', 'B', 'C', 'X', 'Y', 'Z', 'I', 'J', 'SP', 'PC', 'EX', 'IA']
+    # membership checks run on every register access
+    _REGS_SET = frozenset(REGS)
 
     def __init__(self):
         self._regs = defaultdict(lambda: 0)
@@ -14,7 +16,7 @@ class Registers:
         return self.__setattr__(key, value)
 
     def __getattr__(self, item):
-        if item not in self.REGS:
+        if item not in self._REGS_SET:
             raise Exception
         return self._regs[item]
 
@@ -23,7 +25,7 @@ class Registers:
             super.__setattr__(self, key, value)
             return
 
-        if key not in self.REGS:
+        if key not in self._REGS_SET:
             raise Exception(f'Unrecognized register {key}')
 
         self._regs[key] = value
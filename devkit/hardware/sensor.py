@@ -1,3 +1,5 @@
+from collections import deque
+
 from hardware.common import Hardware
 from hardware import Registers, RAM
 
@@ -53,18 +55,23 @@ class Sensor(Hardware):
     VENDOR = 0x54482B2B
     TYPE = 'sensor'
 
+    # meters, distance 0xffff
+    RANGE = 10000
+
     def __init__(self, regs: Registers, ram: RAM):
         super().__init__(regs, ram)
-        self.contacts = []
+        self.range = self.RANGE
+        # snapshot of the last scan, closest first
+        self.contacts = deque()
         self.actual_situation = []
 
     def handle_interruption(self):
         code = self.regs.A
         if code == 0:
-            self.contacts = self.actual_situation
+            self.contacts = deque(sorted(self.actual_situation, key=lambda contact: contact['range']))
         elif code == 1:
             try:
-                contact = self.contacts.pop()
+                contact = self.contacts.popleft()
                 self.regs.A = contact['type']
                 self.regs.B = contact['id'] >> 16
                 self.regs.C = contact['id'] & 0xffff
@@ -82,4 +89,5 @@ class Sensor(Hardware):
             print(f'[{self.TYPE}] Unexpected interruption code: {code}')
 
     def update_sensor(self, data):
-        self.actual_situation = data
+        """ :param data: contacts around (dicts: type, id, size, range, angle), copied """
+        self.actual_situation = list(data)
@@ -25,6 +25,11 @@ class Thruster(Hardware):
     def handle_interruption(self):
         code = self.regs.A
         if code == 0:
+            if self.regs.I >= len(self.power):
+                print(f'[{self.TYPE}] Unexpected thruster number: {self.regs.I}')
+                return
+
             self.power[self.regs.I] = self.regs.B & 0xff
+            self.changed()
         else:
             print(f'[{self.TYPE}] Unexpected interruption code: {code}')
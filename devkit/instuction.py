@@ -14,5 +14,8 @@ class Instruction:
         self.A = Operator(op_a, nw_a)
         self.B = Operator(op_b, nw_b) if op_b is not None else None
 
+        # instruction length in words, including next words
+        self.words = 1
+
     def __repr__(self):
         return f'<Instruction {self.cmd} {self.B} {self.A}>'
@@ -0,0 +1,72 @@
+import re
+
+
+class LexerError(Exception):
+    pass
+
+
+# expression tokens, shared by `tokenize` and `tokenize_line`
+_EXPRESSION_TOKENS = r'''
+    (?P<number>0[xX][0-9A-Fa-f]+|0[bB][01]+|\d+)|
+    (?P<char>'(?:\\.|[^'\\])')|
+    (?P<symbol>[A-Za-z_.][A-Za-z0-9_.]*)|
+    (?P<op><<|>>|[-+*/%&|^~()])
+'''
+
+TOKEN_RE = re.compile(r'(?P<space>\s+)|' + _EXPRESSION_TOKENS, re.VERBOSE)
+
+LINE_TOKEN_RE = re.compile(r'''
+    (?P<space>\s+)|
+    (?P<comment>;.*)|
+    (?P<label>:[A-Za-z0-9_.]+)|
+    (?P<string>"(?:\\.|[^"\\])*"?)|
+    (?P<brace>[\[\]])|
+    (?P<comma>,)|
+''' + _EXPRESSION_TOKENS + r'''|
+    (?P<other>.)
+''', re.VERBOSE)
+
+
+def tokenize(text: str):
+    """ Splits operand expression into (kind, text) tokens.
+
+    Kinds: number, char, symbol, op. Whitespace is skipped.
+    """
+    pos = 0
+    while pos < len(text):
+        match = TOKEN_RE.match(text, pos)
+        if match is None:
+            raise LexerError(f'Unexpected character: {text[pos]!r}')
+
+        pos = match.end()
+        if match.lastgroup != 'space':
+            yield match.lastgroup, match.group()
+
+
+def number_value(text: str) -> int:
+    """ Value of `number` token """
+    if text[:2] in ('0x', '0X'):
+        return int(text, 16)
+    if text[:2] in ('0b', '0B'):
+        return int(text, 2)
+    return int(text)
+
+
+def char_value(text: str) -> int:
+    """ Value of `char` token """
+    char = text[1:-1]
+    if char.startswith('\\'):
+        char = char.encode().decode('unicode_escape')
+    return ord(char)
+
+
+def tokenize_line(line: str):
+    """ Splits a whole source line into (kind, start, end) tokens.
+
+    Never fails: besides the `tokenize` kinds there are comment, label,
+    string, brace, comma and `other` for anything unknown. Whitespace is
+    skipped.
+    """
+    for match in LINE_TOKEN_RE.finditer(line):
+        if match.lastgroup != 'space':
+            yield match.lastgroup, match.start(), match.end()
@@ -0,0 +1,237 @@
+import argparse
+import struct
+
+from source_map import SourceMap, map_location
+
+
+class LinkError(Exception):
+    pass
+
+
+class ObjectModule:
+    """ Relocatable DASM object (.obj)
+
+    Code is assembled as if loaded at address 0. Every word listed in
+    `relocations` holds an addend, the linker adds to it either the module
+    base address (symbol index `BASE`) or the value of imported symbol
+    `imports[index]`. Exported labels are offsets from the base address,
+    exported constants are absolute values.
+
+    Binary layout (little-endian):
+
+        header   : magic "DOBJ", version, words, exports, constants, imports, relocations, files, lines
+        code     : u16 * words
+        exports  : (name, u16 offset) * exports
+        constants: (name, u16 value) * constants
+        imports  : name * imports
+        relocs   : (u16 offset, u16 symbol index) * relocations
+        files    : name * files
+        lines    : (u16 offset, u16 file index, u32 line number) * lines
+
+    Names are u16 length prefixed utf-8 strings. The line table is optional
+    debug info, it maps the first word of every source line.
+    """
+
+    MAGIC = b'DOBJ'
+    VERSION = 2
+    BASE = 0xffff
+
+    HEADER = struct.Struct('<4sHHHHHHHH')
+    EXPORT = struct.Struct('<H')
+    RELOC = struct.Struct('<HH')
+    LINE = struct.Struct('<HHI')
+
+    def __init__(self, code=None, exports=None, constants=None, imports=None, relocations=None, files=None,
+                 lines=None):
+        self.code = code or []
+        self.exports = exports or {}
+        self.constants = constants or {}
+        self.imports = imports or []
+        self.relocations = relocations or []
+        self.files = files or []
+        self.lines = lines or []
+
+    def __repr__(self):
+        return f'<ObjectModule words: {len(self.code)} exports: {len(self.exports)} ' \
+               f'imports: {len(self.imports)} relocations: {len(self.relocations)}>'
+
+    def to_bytes(self) -> bytes:
+        chunks = [self.HEADER.pack(
+            self.MAGIC, self.VERSION, len(self.code), len(self.exports), len(self.constants), len(self.imports),
+            len(self.relocations), len(self.files), len(self.lines),
+        )]
+
+        chunks.append(struct.pack(f'<{len(self.code)}H', *self.code))
+
+        for name, offset in self.exports.items():
+            chunks.append(_pack_name(name))
+            chunks.append(self.EXPORT.pack(offset))
+
+        for name, value in self.constants.items():
+            chunks.append(_pack_name(name))
+            chunks.append(self.EXPORT.pack(value))
+
+        for name in self.imports:
+            chunks.append(_pack_name(name))
+
+        for offset, symbol in self.relocations:
+            chunks.append(self.RELOC.pack(offset, symbol))
+
+        for name in self.files:
+            chunks.append(_pack_name(name))
+
+        for offset, file_index, line_num in self.lines:
+            chunks.append(self.LINE.pack(offset, file_index, line_num))
+
+        return b''.join(chunks)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'ObjectModule':
+        magic, version, n_words, n_exports, n_constants, n_imports, n_relocs, n_files, n_lines = \
+            cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise LinkError('Not a DASM object file')
+
+        pos = cls.HEADER.size
+
+        code = list(struct.unpack_from(f'<{n_words}H', data, pos))
+        pos += n_words * 2
+
+        exports = {}
+        for _ in range(n_exports):
+            name, pos = _unpack_name(data, pos)
+            exports[name], = cls.EXPORT.unpack_from(data, pos)
+            pos += cls.EXPORT.size
+
+        constants = {}
+        for _ in range(n_constants):
+            name, pos = _unpack_name(data, pos)
+            constants[name], = cls.EXPORT.unpack_from(data, pos)
+            pos += cls.EXPORT.size
+
+        imports = []
+        for _ in range(n_imports):
+            name, pos = _unpack_name(data, pos)
+            imports.append(name)
+
+        relocations = []
+        for _ in range(n_relocs):
+            relocations.append(cls.RELOC.unpack_from(data, pos))
+            pos += cls.RELOC.size
+
+        files = []
+        for _ in range(n_files):
+            name, pos = _unpack_name(data, pos)
+            files.append(name)
+
+        lines = []
+        for _ in range(n_lines):
+            lines.append(cls.LINE.unpack_from(data, pos))
+            pos += cls.LINE.size
+
+        return cls(code, exports, constants, imports, relocations, files, lines)
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, filename) -> 'ObjectModule':
+        with open(filename, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+
+def _pack_name(name: str) -> bytes:
+    data = name.encode()
+    return struct.pack('<H', len(data)) + data
+
+
+def _unpack_name(data: bytes, pos: int):
+    length, = struct.unpack_from('<H', data, pos)
+    pos += 2
+    return data[pos:pos + length].decode(), pos + length
+
+
+class Linker:
+    """ Lays out objects one after another and patches relocations.
+
+    The first object is placed at address 0, so it should be the program
+    entry. Imports are resolved against exports of all other objects, a
+    symbol exported by more than one of them is an error.
+    """
+
+    def __init__(self, objects):
+        self.objects = list(objects)
+
+    def layout(self):
+        """ Base address of every object """
+        bases = []
+        pc = 0
+        for obj in self.objects:
+            bases.append(pc)
+            pc += len(obj.code)
+
+        if pc > 0x10000:
+            raise LinkError(f'Program does not fit into RAM: {pc} words')
+
+        return bases
+
+    def symbols(self, bases):
+        """ Global symbol table: name -> list of values """
+        table = {}
+        for obj, base in zip(self.objects, bases):
+            for name, offset in obj.exports.items():
+                table.setdefault(name, []).append(base + offset)
+            for name, value in obj.constants.items():
+                table.setdefault(name, []).append(value)
+
+        return table
+
+    def link(self):
+        """ :return: list of program words """
+        bases = self.layout()
+        table = self.symbols(bases)
+
+        program = []
+        for obj_num, (obj, base) in enumerate(zip(self.objects, bases)):
+            resolved = []
+            for name in obj.imports:
+                addresses = table.get(name)
+                if not addresses:
+                    raise LinkError(f'Object {obj_num}: unresolved symbol {name}')
+                if len(addresses) > 1:
+                    raise LinkError(f'Object {obj_num}: symbol {name} defined in several objects')
+                resolved.append(addresses[0])
+
+            code = list(obj.code)
+            for offset, symbol in obj.relocations:
+                target = base if symbol == ObjectModule.BASE else resolved[symbol]
+                code[offset] = (code[offset] + target) & 0xffff
+
+            program.extend(code)
+
+        return program
+
+    def source_map(self) -> SourceMap:
+        """ Source map built from line tables of the objects """
+        source_map = SourceMap()
+        for obj, base in zip(self.objects, self.layout()):
+            for offset, file_index, line_num in obj.lines:
+                source_map.add(base + offset, obj.files[file_index], line_num)
+            source_map.size = base + len(obj.code)
+
+        return source_map
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('objects', nargs='+')
+    parser.add_argument('--output', type=str, required=True)
+    args = parser.parse_args()
+
+    linker = Linker([ObjectModule.load(filename) for filename in args.objects])
+    with open(args.output, 'wb') as f:
+        for code in linker.link():
+            f.write(code.to_bytes(2, byteorder='little'))
+
+    linker.source_map().save(map_location(args.output))
@@ -0,0 +1,213 @@
+import numpy as np
+
+from hardware import Display
+
+
+def rgb32(r, g, b):
+    """ 0xffRRGGBB, same as Qt `qRgb` """
+    return 0xff000000 | (r << 16) | (g << 8) | b
+
+
+class GlyphAtlas:
+    """ Pre-rasterized glyph tiles for every foreground/background pair.
+
+    `tiles[fg, bg, char]` is a (CELL_HEIGHT, CELL_WIDTH) block of colors,
+    so drawing a cell is a single copy. After the initial `build` only the
+    tiles of changed glyphs or colors are re-rasterized.
+    """
+
+    def __init__(self, cell_width, cell_height):
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.bits = None
+        self.palette = None
+        self.tiles = None
+
+    def build(self, font_words: np.ndarray, palette: np.ndarray):
+        self.bits = glyph_bits(font_words, self.cell_height)
+        self.palette = palette.copy()
+        self.tiles = np.where(
+            self.bits[None, None],
+            palette[:, None, None, None, None],
+            palette[None, :, None, None, None],
+        )
+
+    def set_glyphs(self, chars: np.ndarray, font_words: np.ndarray):
+        """ :param font_words: (len(chars), 2) new words of the glyphs """
+        self.bits[chars] = glyph_bits(font_words, self.cell_height)
+        self.tiles[:, :, chars] = np.where(
+            self.bits[chars][None, None],
+            self.palette[:, None, None, None, None],
+            self.palette[None, :, None, None, None],
+        )
+
+    def set_palette(self, palette: np.ndarray) -> np.ndarray:
+        """ :return: indexes of colors which changed """
+        colors = np.flatnonzero(palette != self.palette)
+        if len(colors):
+            self.palette = palette.copy()
+            self.tiles[colors] = np.where(
+                self.bits[None, None],
+                palette[colors][:, None, None, None, None],
+                palette[None, :, None, None, None],
+            )
+            self.tiles[:, colors] = np.where(
+                self.bits[None, None],
+                palette[:, None, None, None, None],
+                palette[colors][None, :, None, None, None],
+            )
+
+        return colors
+
+
+def glyph_bits(font_words: np.ndarray, cell_height) -> np.ndarray:
+    """ (n, 2) font words -> (n, cell_height, 4) bool bitmaps """
+    # four column bytes per glyph: hi >> 8, hi & 0xff, lo >> 8, lo & 0xff
+    columns = np.stack([
+        font_words[:, 0] >> 8, font_words[:, 0] & 0xff, font_words[:, 1] >> 8, font_words[:, 1] & 0xff,
+    ], axis=1)
+
+    bits = (columns[:, :, None] >> np.arange(cell_height, dtype=np.uint16)) & 1
+    return bits.transpose(0, 2, 1).astype(bool)
+
+
+class DisplayRenderer:
+    """ LEM1802 frame renderer.
+
+    Keeps both blink phases of the frame and the VRAM words they were
+    drawn from. Every `update` asks the display which cells, glyphs and
+    palette entries were written since the previous one and copies
+    `GlyphAtlas` tiles into the affected cells only, idle frames cost
+    nothing. Blinking is a swap between the two cached frames.
+
+    Frames are (FRAME_HEIGHT, FRAME_WIDTH) uint32 arrays of `rgb32` colors,
+    the 128x96 screen surrounded by a BORDER pixels wide border.
+    """
+
+    COLUMNS = 32
+    ROWS = 12
+    CELL_WIDTH = 4
+    CELL_HEIGHT = 8
+
+    WIDTH = COLUMNS * CELL_WIDTH
+    HEIGHT = ROWS * CELL_HEIGHT
+
+    BORDER = 8
+    FRAME_WIDTH = WIDTH + 2 * BORDER
+    FRAME_HEIGHT = HEIGHT + 2 * BORDER
+
+    # seconds per blink phase
+    BLINK_INTERVAL = 0.5
+
+    def __init__(self, display: Display):
+        self.display = display
+        self.atlas = GlyphAtlas(self.CELL_WIDTH, self.CELL_HEIGHT)
+        # [0] blinking cells shown, [1] blinking cells hidden
+        self.frames = np.zeros((2, self.FRAME_HEIGHT, self.FRAME_WIDTH), dtype=np.uint32)
+        self.vram = None
+        self.border = None
+
+    @classmethod
+    def blink_phase(cls, seconds) -> int:
+        """ Frame index for `render` at given time """
+        return int(seconds / cls.BLINK_INTERVAL) % 2
+
+    def read_vram(self, offsets=None) -> np.ndarray:
+        """ Cell words, all of them (ROWS, COLUMNS) or only `offsets` """
+        start = self.display.video_ram
+        if offsets is None:
+            offsets = range(self.COLUMNS * self.ROWS)
+        words = [self.display.ram[(start + offset) & 0xffff] for offset in offsets]
+        return np.array(words, dtype=np.uint16)
+
+    def font_words(self, chars=range(128)) -> np.ndarray:
+        """ (len(chars), 2) glyph words """
+        return np.array([self.display.get_char(char) for char in chars], dtype=np.uint16).reshape(-1, 2)
+
+    def palette(self) -> np.ndarray:
+        """ 16 `rgb32` colors """
+        return np.array(self.display.load_palette(rgb32), dtype=np.uint32)
+
+    def invalidate(self):
+        """ Redraw everything on the next update """
+        self.vram = None
+
+    def _cells(self, phase):
+        """ (ROWS, CELL_HEIGHT, COLUMNS, CELL_WIDTH) view of the screen """
+        screen = self.frames[phase, self.BORDER:self.BORDER + self.HEIGHT, self.BORDER:self.BORDER + self.WIDTH]
+        return screen.reshape(self.ROWS, self.CELL_HEIGHT, self.COLUMNS, self.CELL_WIDTH)
+
+    def _draw_cells(self, rows, columns):
+        words = self.vram[rows, columns]
+        chars = words & 0x007f
+        fg = (words >> 12) & 0xf
+        bg = (words >> 8) & 0xf
+
+        self._cells(0)[rows, :, columns, :] = self.atlas.tiles[fg, bg, chars]
+        self._cells(1)[rows, :, columns, :] = self.atlas.tiles[np.where(words & 0x0080, bg, fg), bg, chars]
+
+    def _draw_border(self) -> bool:
+        """ :return: False if border color did not change """
+        color = self.atlas.palette[self.display.border_color]
+        if color == self.border:
+            return False
+
+        self.border = color
+        self.frames[:, :self.BORDER] = color
+        self.frames[:, -self.BORDER:] = color
+        self.frames[:, :, :self.BORDER] = color
+        self.frames[:, :, -self.BORDER:] = color
+        return True
+
+    def update(self) -> bool:
+        """ Redraw changed cells and border
+
+        :return: False if frames did not change
+        """
+        changes = self.display.take_changes()
+
+        if changes is None or self.vram is None:
+            self.atlas.build(self.font_words(), self.palette())
+            self.vram = self.read_vram().reshape(self.ROWS, self.COLUMNS)
+            self.border = None
+
+            self._draw_cells(*np.indices((self.ROWS, self.COLUMNS)).reshape(2, -1))
+            self._draw_border()
+            return True
+
+        offsets, glyphs, colors = changes
+        if not (offsets or glyphs or colors):
+            return self._draw_border()
+
+        dirty = np.zeros((self.ROWS, self.COLUMNS), dtype=bool)
+
+        if offsets:
+            offsets = np.fromiter(offsets, dtype=np.intp, count=len(offsets))
+            self.vram.flat[offsets] = self.read_vram(offsets)
+            dirty.flat[offsets] = True
+
+        if glyphs:
+            glyphs = np.fromiter(glyphs, dtype=np.intp, count=len(glyphs))
+            self.atlas.set_glyphs(glyphs, self.font_words(glyphs))
+            dirty |= np.isin(self.vram & 0x007f, glyphs)
+
+        if colors:
+            colors = self.atlas.set_palette(self.palette())
+            dirty |= np.isin((self.vram >> 12) & 0xf, colors) | np.isin((self.vram >> 8) & 0xf, colors)
+
+        rows, columns = np.nonzero(dirty)
+        if len(rows):
+            self._draw_cells(rows, columns)
+
+        return self._draw_border() or bool(len(rows))
+
+    def render(self, phase=0) -> np.ndarray:
+        """ :return: up to date frame of blink `phase` """
+        self.update()
+        return self.frames[phase]
+
+    @staticmethod
+    def blit(frame: np.ndarray, buffer):
+        """ Copies frame into 32 bit image memory (e.g. `QImage.bits()`) """
+        target = np.frombuffer(buffer, dtype=np.uint32, count=frame.size).reshape(frame.shape)
+        np.copyto(target, frame)
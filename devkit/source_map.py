@@ -0,0 +1,152 @@
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+
+
+class SourceMap:
+    """ PC ranges -> (file, line), sidecar of the .bin (.map)
+
+    Stored as parallel sorted arrays: `starts` holds the first word of
+    every source line, the line covers words up to the next start (or
+    `size` for the last one). Lookup is a binary search.
+
+    Binary layout (little-endian):
+
+        header : magic "DMAP", version, files, entries, size (program words)
+        files  : u16 length prefixed utf-8 names
+        starts : u16 * entries
+        files  : u16 * entries (index into file names)
+        lines  : u32 * entries
+    """
+
+    MAGIC = b'DMAP'
+    VERSION = 1
+
+    HEADER = struct.Struct('<4sHHII')
+
+    def __init__(self, files=None, starts=None, file_indexes=None, lines=None, size=0):
+        self.files = files or []
+        self.starts = starts or array('H')
+        self.file_indexes = file_indexes or array('H')
+        self.lines = lines or array('I')
+        self.size = size
+
+        self._line_to_pc = {}
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __repr__(self):
+        return f'<SourceMap files: {len(self.files)} entries: {len(self.starts)} size: {self.size}>'
+
+    def add(self, pc, filename, line_num):
+        """ Append entry, PCs must be added in increasing order """
+        try:
+            file_index = self.files.index(filename)
+        except ValueError:
+            file_index = len(self.files)
+            self.files.append(filename)
+
+        self.starts.append(pc)
+        self.file_indexes.append(file_index)
+        self.lines.append(line_num)
+        self._line_to_pc.clear()
+
+    @classmethod
+    def from_program(cls, program) -> 'SourceMap':
+        """ :param program: `DCPUTranslator.asm2bin` result """
+        source_map = cls()
+        pc = 0
+        for filename, line_num, _, instructions in program:
+            source_map.add(pc, filename, line_num)
+            pc += len(instructions)
+
+        source_map.size = pc
+        return source_map
+
+    def lookup(self, pc):
+        """ :return: (file, line) of the instruction which covers pc or None """
+        if pc >= self.size:
+            return None
+
+        pos = bisect_right(self.starts, pc) - 1
+        if pos < 0:
+            return None
+
+        return self.files[self.file_indexes[pos]], self.lines[pos]
+
+    def line_to_pc(self, filename) -> array:
+        """ First PC of every line of one file, -1 for lines without code (cached) """
+        if filename not in self._line_to_pc:
+            mapping = array('i')
+            if filename in self.files:
+                file_index = self.files.index(filename)
+                for pc, index, line_num in zip(self.starts, self.file_indexes, self.lines):
+                    if index != file_index:
+                        continue
+
+                    if line_num >= len(mapping):
+                        mapping.extend([-1] * (line_num + 1 - len(mapping)))
+                    if mapping[line_num] < 0:
+                        mapping[line_num] = pc
+
+            self._line_to_pc[filename] = mapping
+
+        return self._line_to_pc[filename]
+
+    def to_bytes(self) -> bytes:
+        chunks = [self.HEADER.pack(self.MAGIC, self.VERSION, len(self.files), len(self.starts), self.size)]
+
+        for name in self.files:
+            data = name.encode()
+            chunks.append(struct.pack('<H', len(data)) + data)
+
+        for arr in (self.starts, self.file_indexes, self.lines):
+            if sys.byteorder != 'little':
+                arr = array(arr.typecode, arr)
+                arr.byteswap()
+            chunks.append(arr.tobytes())
+
+        return b''.join(chunks)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'SourceMap':
+        magic, version, n_files, n_entries, size = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError('Not a source map file')
+
+        pos = cls.HEADER.size
+
+        files = []
+        for _ in range(n_files):
+            length, = struct.unpack_from('<H', data, pos)
+            pos += 2
+            files.append(data[pos:pos + length].decode())
+            pos += length
+
+        arrays = []
+        for typecode, itemsize in (('H', 2), ('H', 2), ('I', 4)):
+            arr = array(typecode)
+            arr.frombytes(data[pos:pos + n_entries * itemsize])
+            if sys.byteorder != 'little':
+                arr.byteswap()
+            arrays.append(arr)
+            pos += n_entries * itemsize
+
+        return cls(files, *arrays, size=size)
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, filename) -> 'SourceMap':
+        with open(filename, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+
+def map_location(bin_location):
+    """ Sidecar source map location for .bin file """
+    return f'{os.path.splitext(bin_location)[0]}.map'
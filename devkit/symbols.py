@@ -0,0 +1,156 @@
+from constants import REGISTERS
+from lexer import tokenize_line
+from translator import DCPUTranslator, TranslationError
+
+
+# directives whose operands are not symbol uses
+SKIPPED_DIRECTIVES = ('.include', '.macro', '.endm', '.endr')
+
+
+def scan_symbols(lines):
+    """ Definitions and references of one file from source tokens, before
+        macro expansion and constant folding, so constants folded away and
+        lines which do not assemble yet are seen as well
+
+    :return: definitions {name: line}, references [(name, line)]
+    """
+    definitions = {}
+    references = []
+
+    for line_num, line in enumerate(lines):
+        tokens = [(kind, line[start:end]) for kind, start, end in tokenize_line(line) if kind != 'comment']
+
+        pos = 0
+        while pos < len(tokens) and tokens[pos][0] == 'label':
+            definitions.setdefault(tokens[pos][1][1:], line_num)
+            pos += 1
+
+        if pos == len(tokens):
+            continue
+
+        # mnemonic, directive or macro name
+        command = tokens[pos][1].lower()
+        pos += 1
+        if command in SKIPPED_DIRECTIVES:
+            continue
+
+        if command in ('.equ', '.define') and pos < len(tokens) and tokens[pos][0] == 'symbol':
+            definitions.setdefault(tokens[pos][1], line_num)
+            pos += 1
+
+        for index in range(pos, len(tokens)):
+            kind, text = tokens[index]
+            if kind != 'symbol' or text in REGISTERS:
+                continue
+
+            # `\param` of a macro body
+            if tokens[index - 1] == ('other', '\\'):
+                continue
+
+            references.append((text, line_num))
+
+    return definitions, references
+
+
+class SymbolIndex:
+    """ Project-wide index of labels and constants.
+
+    Definitions and references come from source tokens (`scan_symbols`),
+    so a file which does not assemble in the middle of an edit is still
+    indexed. Labels made by macro expansion are taken from fragments of
+    `DCPUTranslator.encode_file`, from the last translation of the file
+    which succeeded. Every file keeps its own definitions and references,
+    `update_file` swaps them for one file without touching the rest.
+    Lines are 0-based, like in the editor. Label addresses come from the
+    last successful build, see `set_addresses`.
+    """
+
+    def __init__(self, translator: DCPUTranslator = None):
+        self.translator = translator or DCPUTranslator()
+
+        # filename -> (definitions {name: line}, references [(name, line)])
+        self._files = {}
+        # filename -> {name: line} of labels made by macro expansion, from
+        # the last successful translation
+        self._expanded = {}
+
+        self.definitions = {}
+        self.references = {}
+        # label -> address of the last successful build
+        self.addresses = {}
+
+    def __repr__(self):
+        return f'<SymbolIndex files: {len(self._files)} symbols: {len(self.definitions)}>'
+
+    def update_file(self, workdir, filename) -> bool:
+        """ Re-index one file
+
+        :return: False if the file does not translate, it is indexed from
+            its tokens then; if it can not be read, previous entry is kept
+        """
+        try:
+            lines, _ = self.translator.read_source(workdir, filename, cache={})
+        except (TranslationError, OSError):
+            return False
+
+        definitions, references = scan_symbols(lines)
+
+        translated = True
+        try:
+            fragments = self.translator.encode_file(workdir, filename)
+        except (TranslationError, OSError):
+            translated = False
+        else:
+            self._expanded[filename] = {
+                fragment.symbol: fragment.line_num
+                for fragment in reversed(fragments)
+                if fragment.filename == filename and fragment.cmd in ('__LABEL', '__EQU')
+                and fragment.symbol not in definitions
+            }
+
+        for name, line_num in self._expanded.get(filename, {}).items():
+            definitions.setdefault(name, line_num)
+
+        self.remove_file(filename)
+        self._files[filename] = definitions, references
+
+        for name, line_num in definitions.items():
+            self.definitions.setdefault(name, []).append((filename, line_num))
+        for name, line_num in references:
+            self.references.setdefault(name, []).append((filename, line_num))
+
+        return translated
+
+    def remove_file(self, filename):
+        if filename not in self._files:
+            return
+
+        definitions, references = self._files.pop(filename)
+        for table, names in ((self.definitions, definitions), (self.references, [name for name, _ in references])):
+            for name in set(names):
+                locations = [location for location in table[name] if location[0] != filename]
+                if locations:
+                    table[name] = locations
+                else:
+                    del table[name]
+
+    def index_project(self, workdir, filenames):
+        for filename in filenames:
+            self.update_file(workdir, filename)
+
+    def set_addresses(self, labels):
+        """ :param labels: label addresses of a build, `DCPUTranslator.translate` result """
+        self.addresses = dict(labels)
+
+    def address(self, name):
+        """ :return: address of the label in the last build or None """
+        return self.addresses.get(name)
+
+    def definition(self, name):
+        """ :return: (file, line) of the first definition or None """
+        locations = self.definitions.get(name)
+        return locations[0] if locations else None
+
+    def find_references(self, name):
+        """ :return: sorted list of (file, line) """
+        return sorted(set(self.references.get(name, [])))
@@ -0,0 +1,60 @@
+import pytest
+
+from build import ParallelBuilder
+from translator import DCPUTranslator, TranslationError
+
+
+def write(directory, files):
+    for name, text in files.items():
+        (directory / name).write_bytes(text if isinstance(text, bytes) else text.encode())
+
+
+@pytest.fixture
+def programs(tmp_path):
+    """ A good program between broken ones, every one in its own project directory """
+    projects = {
+        'good': {'main.dasm': '.include "lib.dasm"\n    SET A, 1\n', 'lib.dasm': ':lib SET B, 2\n'},
+        'cycle': {'main.dasm': '.include "a.dasm"\n', 'a.dasm': '.include "b.dasm"\n', 'b.dasm': '.include "a.dasm"\n'},
+        'binary': {'main.dasm': b'SET A, \xff\n'},
+        'missing': {'main.dasm': '.include "nowhere.dasm"\n'},
+        'good2': {'main.dasm': 'SET C, 3\n'},
+    }
+    result = []
+    for name, files in projects.items():
+        directory = tmp_path / name
+        directory.mkdir()
+        write(directory, files)
+        result.append((str(directory), 'main.dasm'))
+
+    return result
+
+
+@pytest.mark.parametrize('use_pool', [False, True])
+def test_bad_program_does_not_stop_others(programs, use_pool):
+    builder = ParallelBuilder()
+    if use_pool:
+        # pool even on a single CPU machine and for tiny programs
+        builder.jobs = 2
+        builder.MIN_POOL_LINES = 0
+    assert builder.use_pool(programs) is use_pool
+
+    good, cycle, binary, missing, good2 = builder.build(programs)
+
+    assert good == DCPUTranslator().asm2bin(*programs[0])
+    assert good2 == DCPUTranslator().asm2bin(*programs[4])
+
+    assert isinstance(cycle, TranslationError)
+    assert 'Recursive include' in cycle.message
+    assert isinstance(binary, TranslationError)
+    assert 'UTF-8' in binary.message
+    assert isinstance(missing, TranslationError)
+
+
+def test_small_input_skips_pool(programs):
+    builder = ParallelBuilder()
+    builder.jobs = 8
+    assert not builder.use_pool(programs)
+
+    builder.jobs = 1
+    builder.MIN_POOL_LINES = 0
+    assert not builder.use_pool(programs)
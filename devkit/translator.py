@@ -1,8 +1,24 @@
 import argparse
+import hashlib
 import os
+import re
 from enum import Enum
 
-from constants import MNEMONIC_TO_CODE, SPECIAL_MNEMONICS_TO_CODE, REGISTERS
+from constants import MNEMONIC_TO_CODE, SPECIAL_MNEMONICS_TO_CODE, REGISTERS, LITERAL
+from expression import Value, parse_expression
+from lexer import tokenize
+from linker import ObjectModule
+from source_map import SourceMap, map_location
+
+
+CONSTANT_RE = re.compile(r'^([A-Za-z_.][A-Za-z0-9_.]*)\s*,?\s*(.+)$')
+
+# `[1000]`, `[8a00]`: plain number address, hex without prefix like the
+# translator always read it (binary `[0b...]` is not one)
+HEX_ADDRESS_RE = re.compile(r'^\s*(?!0[bB])([0-9][0-9A-Fa-f]*)\s*$')
+
+# pseudo symbol of the object base address, see `DCPUTranslator.assemble_object`
+BASE_SYMBOL = '@base'
 
 
 class OperandType(Enum):
@@ -58,11 +74,156 @@ class TranslationError(Exception):
         self.line = line
         self.message = message
 
+    def __reduce__(self):
+        # keeps the error picklable for process pool builds
+        return TranslationError, (self.file, self.line, self.message)
+
+
+class TranslationErrors(TranslationError):
+    """ All errors of a build, `file`, `line` and `message` are of the first one """
+
+    def __init__(self, errors):
+        first = errors[0]
+        super().__init__(first.file, first.line, '\n'.join(error.message for error in errors))
+        self.errors = errors
+
+    def __reduce__(self):
+        return TranslationErrors, (self.errors,)
+
+
+def add_errors(errors, ex: TranslationError):
+    """ Append error(s) of `ex` to the list, the same error is reported once """
+    for error in getattr(ex, 'errors', [ex]):
+        if not any((e.file, e.line, e.message) == (error.file, error.line, error.message) for e in errors):
+            errors.append(error)
+
+
+def short_literal(value: int):
+    """ Inline `a` operand code for literal value or None if it does not fit """
+    value &= 0xffff
+    return LITERAL.get(-1 if value == 0xffff else value)
+
+
+class Fragment:
+    """ Encoded source line.
+
+    Instruction words are final except for the ones listed in `fixups`,
+    a list of (word index, Value) pairs evaluated by the linker once label
+    addresses are known. Pseudo commands `__LABEL`, `__INCLUDE` and `__EQU`
+    carry no words, their target name is stored in `symbol`, `__EQU` keeps
+    the constant in `value`.
+
+    `relax` is the index of the next word of a literal `a` operand which is
+    not known yet. The linker drops the word and encodes the literal into
+    the instruction when the value fits -1..30.
+    """
+
+    def __init__(self, filename, line_num, line, cmd, words=None, fixups=None, symbol=None, value=None,
+                 relax=None):
+        self.filename = filename
+        self.line_num = line_num
+        self.line = line
+        self.cmd = cmd
+        self.words = words or []
+        self.fixups = fixups or []
+        self.symbol = symbol
+        self.value = value
+        self.relax = relax
+
+    def size(self, short=False):
+        return len(self.words) - 1 if short else len(self.words)
+
+    def encode(self, symbols, short=False):
+        """ Instruction words with fixups evaluated
+
+        :param short: use short literal form for `relax` word
+        """
+        instructions = list(self.words)
+        for index, value in self.fixups:
+            instructions[index] = value.evaluate(symbols)
+
+        if short:
+            literal = short_literal(instructions.pop(self.relax))
+            instructions[0] = (instructions[0] & 0x03ff) | literal << 10
+
+        return instructions
+
+    def __repr__(self):
+        return f'<Fragment {self.filename}:{self.line_num} {self.cmd} {self.words} {self.fixups}>'
+
+
+class Macro:
+    """ `.macro name param, ...` definition, body lines are kept as text.
+
+    Parameters are referenced as `\\param` in the body, `\\@` expands to a
+    suffix unique for every expansion (for local labels).
+    """
+
+    PARAM_RE = re.compile(r'\\([A-Za-z_][A-Za-z0-9_]*|@)')
+
+    def __init__(self, name, params, filename, line_num):
+        self.name = name
+        self.params = params
+        self.filename = filename
+        self.line_num = line_num
+        self.body = []
+
+    def __repr__(self):
+        return f'<Macro {self.name} {self.params} {len(self.body)} lines>'
+
+    def key(self):
+        return self.name, tuple(self.params), tuple(self.body)
+
+    def substitute(self, args: str, unique: str):
+        """ :return: body lines with parameters replaced by invocation arguments """
+        args = [arg.strip() for arg in args.split(',')] if args.strip() else []
+        if len(args) != len(self.params):
+            raise Exception(f'Macro {self.name} expects {len(self.params)} arguments, got {len(args)}')
+
+        values = dict(zip(self.params, args))
+        values['@'] = unique
+
+        return [
+            self.PARAM_RE.sub(lambda match: values.get(match.group(1), match.group()), text)
+            for text in self.body
+        ]
+
 
 class DCPUTranslator:
-    """ .dcpu16 -> .bin """
+    """ .dcpu16 -> .bin
+
+    Every source and include file is parsed and encoded on its own, the
+    result is cached by file content. Rebuild after an edit re-encodes
+    only the changed files and re-links label addresses.
+
+    Operands are expressions (`label+2`, `[A+0x10]`, `SIZE*2`), folded at
+    assembly time. Constants are defined with `.equ NAME, expr` or
+    `.define NAME expr`.
+
+    `.macro name params` ... `.endm` and `.rep N` ... `.endr` blocks are
+    expanded at tokenization time.
+    """
 
     OPCODE_LEN = 3
+    MAX_EXPANSION_DEPTH = 64
+
+    def __init__(self):
+        # path -> ((mtime, size), digest)
+        self._stamps = {}
+        # (filename, digest) -> [Fragment, ...]
+        self._encoded = {}
+        # (filename, digest) -> `scan_macros` result
+        self._scanned = {}
+        # filename -> text used instead of the file on disk (e.g. unsaved editor)
+        self.sources = {}
+
+    @staticmethod
+    def error(filename, line_num, line, message):
+        return TranslationError(
+            filename,
+            line_num,
+            f'FILE: {filename}    LINE:  {line_num}     {line}    ERROR: {message}',
+        )
 
     def parse_line(self, line: str):
         line = line.strip()
@@ -78,180 +239,803 @@ class DCPUTranslator:
 
         return command.strip().upper(), param_1, param_2
 
-    def extract_labels(self, workdir, filename):
-        with open(os.path.join(workdir, filename), 'r') as f:
-            labels = {}
-            for line in f.readlines():
-                line = line.strip()
-                if line.startswith(':'):
-                    other_instr = line.find(' ')
-                    if other_instr != -1:
-                        labels[line[1:other_instr]] = 0
-                    else:
-                        labels[line[1:]] = 0
-
-                if line.startswith('.include '):
-                    if ';' in line:
-                        line = line[0:line.find(';')]
-
-                    include_file = line[len('.include '):].strip()
-                    include_file = include_file[1:-1]
-                    labels.update(self.extract_labels(workdir, include_file))
-
-            return labels
-
-    def operand2bin(self, operand: str, labels: dict):
-        operand_type = OperandType.determine(operand, labels)
-
-        if operand_type is OperandType.NONE:
+    def operand2bin(self, operand: str, constants: dict = None, is_a=False):
+        """ Encode operand.
+
+        :param operand: operand text
+        :param constants: known constants: name -> int or Value
+        :param is_a: operand is `a`, literals -1..30 are encoded inline
+        :return: operand code, next word Value or None
+        """
+        if operand is None:
             return 0, None
-        elif operand_type is OperandType.REGISTER:
+
+        if operand in REGISTERS:
             return REGISTERS[operand], None
-        elif operand_type is OperandType.DECIMAL:
-            return 0x1f, int(operand)
-        elif operand_type is OperandType.HEX:
-            return 0x1f, int(operand, 16)
-        elif operand_type is OperandType.BINARY:
-            return 0x1f, int(operand, 2)
-        elif operand_type is OperandType.REGISTER_POINTER:
-            return 0x08 + REGISTERS.get(operand[1:-1]), None
-        elif operand_type is OperandType.REGISTER_PLUS_NEXT_WORD:
-            reg, label = operand[1:-1].split('+')[:2]
-            return 0x10 + REGISTERS.get(reg.strip()), labels.get(label.strip())
-        elif operand_type is OperandType.LABEL:
-            return 0x1f, labels.get(operand)
-        elif operand_type is OperandType.LABEL_POINTER:
-            return 0x1e, labels.get(operand[1:-1])
-        elif operand_type is OperandType.MEM_ADDRESS:
-            return 0x1e, int(operand[1:-1], 16)
-
-        raise Exception
-
-    def gen_lines(self, workdir, filename):
+
+        if operand[0] == '[' and operand[-1] == ']':
+            address = HEX_ADDRESS_RE.match(operand[1:-1])
+            if address:
+                return 0x1e, Value(int(address.group(1), 16))
+
+            value, register = parse_expression(operand[1:-1], constants, allow_register=True)
+
+            if register is None:
+                return 0x1e, value
+
+            is_plain_register = operand[1:-1].strip() == register
+            if register == 'SP':
+                return (0x19, None) if is_plain_register else (0x1a, value)
+
+            if REGISTERS[register] > 0x07:
+                raise Exception(f'Register {register} can not be used as a pointer')
+
+            if is_plain_register:
+                return 0x08 + REGISTERS[register], None
+
+            return 0x10 + REGISTERS[register], value
+
+        value, _ = parse_expression(operand, constants)
+        if is_a and value.is_constant and short_literal(value.const) is not None:
+            return short_literal(value.const), None
+
+        return 0x1f, value
+
+    def read_source(self, workdir, filename, cache=None):
+        """ Reads source file, returns its lines and content digest.
+
+        Unchanged files (same mtime and size) are not re-hashed.
+
+        :param cache: dict keyed by (filename, digest), lines are None if
+            the file is in it already (default: encoded files)
+        """
+        if cache is None:
+            cache = self._encoded
+
+        if filename in self.sources:
+            text = self.sources[filename]
+            digest = hashlib.sha1(text.encode()).hexdigest()
+            if (filename, digest) in cache:
+                return None, digest
+
+            # edited text is encoded on every change, keep only its latest version
+            for stale in (self._encoded, self._scanned):
+                for key in [key for key in stale if key[0] == filename and key[1] != digest]:
+                    del stale[key]
+
+            return text.splitlines(), digest
+
+        path = os.path.join(workdir, filename)
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        cached = self._stamps.get(path)
+        if cached is not None and cached[0] == stamp and (filename, cached[1]) in cache:
+            return None, cached[1]
+
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        digest = hashlib.sha1(data).hexdigest()
+        self._stamps[path] = (stamp, digest)
+
+        try:
+            return data.decode().splitlines(), digest
+        except UnicodeDecodeError as ex:
+            raise self.error(filename, 0, '', f'Not a UTF-8 text file ({ex.reason})')
+
+    def export_cache(self, workdir, filename):
+        """ Cache entry of already encoded file: (stamp, digest, (fragments, macros, includes key)) """
+        stamp, digest = self._stamps[os.path.join(workdir, filename)]
+        return stamp, digest, self._encoded[(filename, digest)]
+
+    def import_cache(self, workdir, filename, entry):
+        """ Store file encoded by another translator, see `export_cache` """
+        stamp, digest, encoded = entry
+        self._stamps[os.path.join(workdir, filename)] = (stamp, digest)
+        self._encoded[(filename, digest)] = encoded
+
+    def parse_statement(self, filename, line_num, line):
+        """ Tokenize one source line, `.include` directives are kept as `__INCLUDE` pseudo commands """
+        line = line.strip()
+
+        pos = line.find(';')
+        if pos >= 0:
+            line = line[:pos]
+            line = line.strip()
+
+        if not line or line.startswith(';'):
+            return
+
+        if line.startswith('.include '):
+            include_file = line[len('.include '):].strip()
+            include_file = include_file[1:-1]
+            yield filename, line_num, line, '__INCLUDE', include_file, None
+            return
+
+        if line.startswith(('.equ ', '.define ')):
+            match = CONSTANT_RE.match(line.split(None, 1)[1].strip())
+            if match is None:
+                yield filename, line_num, line, '__EQU', None, None
+            else:
+                yield filename, line_num, line, '__EQU', match.group(1), match.group(2).strip()
+            return
+
+        if line.startswith(':'):
+            other_command = line.find(' ')
+
+            if other_command != -1:
+                yield filename, line_num, line, '__LABEL', line.strip()[1:other_command], None
+                line = line[other_command:]
+            else:
+                yield filename, line_num, line, '__LABEL', line.strip()[1:], None
+                return
+
+        cmd, param1, param2 = self.parse_line(line)
+        yield filename, line_num, line, cmd, param1, param2
+
+    def split_blocks(self, filename, lines):
+        """ Group numbered source lines into blocks:
+
+        - ('stmt', [parsed line, ...])
+        - ('macro', Macro)
+        - ('rep', (filename, line_num, line, count), [block, ...])
+
+        :param lines: list of (line_num, text)
+        """
+        root = []
+        stack = [(None, root)]
+        macro_depth = 0
+
+        for line_num, text in lines:
+            directive = text.split(';', 1)[0].strip()
+            keyword = directive.split(None, 1)[0].lower() if directive else ''
+            kind, body = stack[-1]
+
+            if isinstance(kind, Macro):
+                # macro body is kept as text, nested blocks are split on expansion
+                if keyword == '.macro':
+                    macro_depth += 1
+                elif keyword == '.endm' and macro_depth == 0:
+                    stack.pop()
+                    stack[-1][1].append(('macro', kind))
+                    continue
+                elif keyword == '.endm':
+                    macro_depth -= 1
+
+                kind.body.append(text)
+                continue
+
+            if keyword == '.macro':
+                words = directive.split(None, 2)
+                if len(words) < 2:
+                    raise self.error(filename, line_num, directive, 'Macro name is required')
+                params = [p.strip() for p in words[2].split(',')] if len(words) > 2 else []
+                stack.append((Macro(words[1], params, filename, line_num), None))
+            elif keyword == '.rep':
+                words = directive.split(None, 1)
+                if len(words) < 2:
+                    raise self.error(filename, line_num, directive, 'Repeat count is required')
+                stack.append(((filename, line_num, directive, words[1]), []))
+            elif keyword == '.endr':
+                if kind is None:
+                    raise self.error(filename, line_num, directive, '.endr without .rep')
+                stack.pop()
+                stack[-1][1].append(('rep', kind, body))
+            elif keyword == '.endm':
+                raise self.error(filename, line_num, directive, '.endm without .macro')
+            else:
+                body.append(('stmt', list(self.parse_statement(filename, line_num, text))))
+
+        if len(stack) > 1:
+            kind = stack[-1][0]
+            if isinstance(kind, Macro):
+                raise self.error(filename, kind.line_num, f'.macro {kind.name}', 'Missing .endm')
+            raise self.error(*kind[:3], 'Missing .endr')
+
+        return root
+
+    def expand(self, blocks, macros, constants, expansions, depth=0):
+        """ Expand `.rep` blocks and macro invocations into parsed lines
+
+        :param expansions: counter of macro expansions, list with one int, used for `\\@`
+        :param depth: nesting level of `.rep` and macro expansion
+        """
+        for block in blocks:
+            if block[0] == 'macro':
+                macros[block[1].name] = block[1]
+                continue
+
+            if block[0] == 'rep':
+                try:
+                    count, _ = parse_expression(block[1][3], constants)
+                    if not count.is_constant or count.const < 0:
+                        raise Exception('Repeat count must be a non-negative constant')
+                except Exception as ex:
+                    raise self.error(*block[1][:3], ex)
+
+                for _ in range(count.const):
+                    yield from self.expand(block[2], macros, constants, expansions, depth + 1)
+                continue
+
+            for parsed in block[1]:
+                filename, line_num, line, cmd = parsed[:4]
+
+                if depth and cmd == '__EQU':
+                    raise self.error(filename, line_num, line, 'Constants can not be defined inside .macro or .rep')
+
+                name = line.split(None, 1)[0] if cmd not in ('__LABEL', '__INCLUDE', '__EQU') else None
+                if name not in macros:
+                    yield parsed
+                    continue
+
+                if depth >= self.MAX_EXPANSION_DEPTH:
+                    raise self.error(filename, line_num, line, f'Macro {name} expands too deep')
+
+                args = line.split(None, 1)[1] if len(line.split(None, 1)) > 1 else ''
+                unique = f'_{re.sub(r"[^A-Za-z0-9_]", "_", filename)}_{expansions[0]}'
+                expansions[0] += 1
+                try:
+                    body = macros[name].substitute(args, unique)
+                except Exception as ex:
+                    raise self.error(filename, line_num, line, ex)
+
+                # expanded lines are attributed to the invocation line
+                nested = self.split_blocks(filename, [(line_num, text) for text in body])
+                yield from self.expand(nested, macros, constants, expansions, depth + 1)
+
+    def parse_file(self, filename, lines, macros=None):
+        """ Tokenize one file, `.include` directives are kept as `__INCLUDE` pseudo commands.
+
+        Macros and `.rep` blocks are expanded here. `macros` is updated with
+        macros defined in the file, invocations see the macros which are in
+        the dict at the moment they are reached. Repeat counts may use
+        constants defined in the same file.
+        """
+        if macros is None:
+            macros = {}
+
+        blocks = self.split_blocks(filename, list(enumerate(lines)))
+        constants = self.fold_constants([parsed for block in blocks if block[0] == 'stmt' for parsed in block[1]])
+
+        yield from self.expand(blocks, macros, constants, [0])
+
+    def gen_lines(self, workdir, filename, macros=None):
+        if macros is None:
+            macros = {}
+
         with open(os.path.join(workdir, filename), 'r') as f:
-            for line_num, line in enumerate(f.readlines()):
-                line = line.strip()
+            lines = f.readlines()
+
+        for parsed in self.parse_file(filename, lines, macros):
+            if parsed[3] == '__INCLUDE':
+                yield from self.gen_lines(workdir, parsed[4], macros)
+                continue
 
-                pos = line.find(';')
-                if pos >= 0:
-                    line = line[:pos]
-                    line = line.strip()
+            yield parsed
 
-                if not line or line.startswith(';'):
+    def fold_constants(self, parsed):
+        """ Values of constants defined in the file, folded as far as
+            file content allows. Constants from other files stay symbols.
+        """
+        definitions = {}
+        for entry in parsed:
+            if entry[3] == '__EQU':
+                if entry[4] is None:
+                    raise self.error(*entry[:3], 'Bad constant definition')
+                definitions[entry[4]] = entry
+
+        constants = {}
+        folding = set()
+
+        def fold(name):
+            if name in constants:
+                return
+
+            entry = definitions[name]
+            if name in folding:
+                raise self.error(*entry[:3], f'Recursive constant: {name}')
+
+            folding.add(name)
+            try:
+                for kind, text in tokenize(entry[5]):
+                    if kind == 'symbol' and text in definitions:
+                        fold(text)
+
+                constants[name], _ = parse_expression(entry[5], constants)
+            except TranslationError:
+                raise
+            except Exception as ex:
+                raise self.error(*entry[:3], ex)
+
+        for name in definitions:
+            fold(name)
+
+        return constants
+
+    @staticmethod
+    def append_value(words, fixups, value: Value):
+        """ Append word, value which is not known yet becomes a fixup """
+        if value.is_constant:
+            words.append(value.const & 0xffff)
+        else:
+            fixups.append((len(words), value))
+            words.append(0)
+
+    def encode_line(self, filename, line_num, line, cmd, param1, param2, constants=None):
+        if cmd in ('__LABEL', '__INCLUDE'):
+            return Fragment(filename, line_num, line, cmd, symbol=param1)
+
+        if cmd == '__EQU':
+            return Fragment(filename, line_num, line, cmd, symbol=param1, value=constants[param1])
+
+        if cmd == 'DAT':
+            instructions = []
+            fixups = []
+
+            params = [param1, param2]
+            if isinstance(param1, list):
+                params = param1
+
+            for param in params:
+                if param is None:
                     continue
 
-                if line.startswith('.include '):
-                    include_file = line[len('.include '):].strip()
-                    include_file = include_file[1:-1]
-                    for inc_filename, inc_linenum, inc_line, cmd, param1, param2 in self.gen_lines(workdir, include_file):
-                        yield inc_filename, inc_linenum, inc_line, cmd, param1, param2
+                if OperandType.determine(param, labels={}) is OperandType.STRING:
+                    for c in param[1:-1]:
+                        instructions.append(ord(c))
+                else:
+                    self.append_value(instructions, fixups, parse_expression(param, constants)[0])
+
+            return Fragment(filename, line_num, line, cmd, instructions, fixups)
+
+        is_basic_op = True
+        code = MNEMONIC_TO_CODE.get(cmd)
+        if not code:
+            code = SPECIAL_MNEMONICS_TO_CODE.get(cmd)
+            if code is None:
+                raise Exception(f'Unknown instruction: {cmd}')
+            code <<= 5
+            is_basic_op = False
+
+        # special instructions have the only operand, `a`
+        param1coded, nw1 = self.operand2bin(param1, constants, is_a=not is_basic_op)
+        param2coded, nw2 = self.operand2bin(param2, constants, is_a=is_basic_op)
+
+        if is_basic_op:
+            code = code | param1coded << 5 | param2coded << 10
+            nw_a, code_a = nw2, param2coded
+        else:
+            code = code | param1coded << 10
+            nw_a, code_a = nw1, param1coded
+
+        instructions = [code]
+        fixups = []
+        relax = None
+
+        if nw2 is not None:
+            if nw2 is nw_a and code_a == 0x1f and not nw_a.is_constant:
+                relax = len(instructions)
+            self.append_value(instructions, fixups, nw2)
+
+        if nw1 is not None:
+            if nw1 is nw_a and code_a == 0x1f and not nw_a.is_constant:
+                relax = len(instructions)
+            self.append_value(instructions, fixups, nw1)
+
+        return Fragment(filename, line_num, line, cmd, instructions, fixups, relax=relax)
+
+    def scan_macros(self, filename, lines):
+        """ `.include` files and `.macro` definitions in source order, a text
+            scan which neither parses statements nor encodes anything
 
+        :return: list of ('include', (filename, line_num, line)) and ('macro', Macro)
+        """
+        items = []
+        macro = None
+        depth = 0
+
+        for line_num, text in enumerate(lines):
+            directive = text.split(';', 1)[0].strip()
+            keyword = directive.split(None, 1)[0].lower() if directive else ''
+
+            if macro is not None:
+                if keyword == '.macro':
+                    depth += 1
+                elif keyword == '.endm' and depth == 0:
+                    items.append(('macro', macro))
+                    macro = None
                     continue
+                elif keyword == '.endm':
+                    depth -= 1
 
-                if line.startswith(':'):
-                    other_command = line.find(' ')
+                macro.body.append(text)
+            elif keyword == '.macro':
+                # bad definitions are reported when the file is encoded
+                words = directive.split(None, 2)
+                if len(words) >= 2:
+                    params = [p.strip() for p in words[2].split(',')] if len(words) > 2 else []
+                    macro = Macro(words[1], params, filename, line_num)
+            elif directive.startswith('.include '):
+                items.append(('include', (directive[len('.include '):].strip()[1:-1], line_num, directive)))
 
-                    if other_command != -1:
-                        yield filename, line_num, line, '__LABEL', line.strip()[1:other_command], None
-                        line = line[other_command:]
-                    else:
-                        yield filename, line_num, line, '__LABEL', line.strip()[1:], None
-                        continue
+        return items
 
-                cmd, param1, param2 = self.parse_line(line)
-                yield filename, line_num, line, cmd, param1, param2
+    def exported_macros(self, workdir, filename, including=()) -> dict:
+        """ Macros visible at the end of the file: its own and the ones of its includes.
 
-    def asm2bin(self, workdir, filename):
-        relocations, _ = self.translate(workdir, filename, relocations_info=None)
-        _, program = self.translate(workdir, filename, relocations_info=relocations)
+        Found by `scan_macros`, so a file is encoded without encoding its
+        includes (`build.ParallelBuilder` encodes them in other processes).
+        Macros which are defined only by expanding another macro are not
+        exported.
 
-        return program
+        :param including: files which include this one, outermost first
+        """
+        lines, digest = self.read_source(workdir, filename, self._scanned)
+        if lines is not None:
+            self._scanned[(filename, digest)] = self.scan_macros(filename, lines)
 
-    def translate(self, workdir, filename, relocations_info=None, dat_labels_out=None):
-        if relocations_info is None:
-            relocations_info = self.extract_labels(workdir, filename)
+        including = including + (filename,)
 
-        labels_addr = {}
+        macros = {}
+        for kind, item in self._scanned[(filename, digest)]:
+            if kind == 'include':
+                include_file, line_num, line = item
+                if include_file in including:
+                    raise self.recursive_include(filename, line_num, line, including + (include_file,))
+                macros.update(self.exported_macros(workdir, include_file, including))
+            else:
+                macros[item.name] = item
 
-        program = []
+        return macros
+
+    def recursive_include(self, filename, line_num, line, chain):
+        return self.error(filename, line_num, line, f'Recursive include: {" -> ".join(chain)}')
+
+    def includes_key(self, workdir, filename, fragments):
+        """ Macros exported by included files, the encoded file depends on them """
+        key = []
+        for fragment in fragments:
+            if fragment.cmd == '__INCLUDE':
+                macros = self.exported_macros(workdir, fragment.symbol, (filename,))
+                key.append((fragment.symbol, tuple(sorted(macro.key() for macro in macros.values()))))
+
+        return tuple(key)
+
+    def encode_file(self, workdir, filename):
+        """ Parsed and encoded file content, cached by content digest """
+        return self.encode_entry(workdir, filename)[0]
+
+    def encode_entry(self, workdir, filename):
+        """ Cache entry of the file: (fragments, macros visible at the end of the file, includes key)
+
+        Macros defined in included files are visible in the including file
+        after the `.include` line, so cached entry is valid only while
+        macros of the included files stay the same.
+        """
+        lines, digest = self.read_source(workdir, filename)
+
+        cached = self._encoded.get((filename, digest))
+        if cached is not None:
+            try:
+                if cached[2] == self.includes_key(workdir, filename, cached[0]):
+                    return cached
+            except (TranslationError, OSError):
+                # includes broke since, encoding again reports it
+                pass
+
+        if lines is None:
+            # cached encoding is stale (macros of includes changed), the text
+            # is read again, from the editor buffer if there is one
+            lines, digest = self.read_source(workdir, filename, cache={})
+
+        # bad lines do not stop encoding, all of them are reported at once
+        errors = []
+
+        macros = {}
+        parsed = []
+        for entry in self.parse_file(filename, lines, macros):
+            if entry[3] == '__INCLUDE':
+                try:
+                    macros.update(self.exported_macros(workdir, entry[4], (filename,)))
+                except TranslationError as ex:
+                    add_errors(errors, ex)
+                except OSError as ex:
+                    add_errors(errors, self.error(*entry[:3], ex))
+            parsed.append(entry)
+
+        try:
+            constants = self.fold_constants(parsed)
+        except TranslationError as ex:
+            add_errors(errors, ex)
+            raise TranslationErrors(errors)
+
+        fragments = []
+        for resolver_filename, line_num, line, cmd, param1, param2 in parsed:
+            try:
+                fragments.append(self.encode_line(resolver_filename, line_num, line, cmd, param1, param2, constants))
+            except Exception as ex:
+                add_errors(errors, self.error(resolver_filename, line_num, line, ex))
+
+        if errors:
+            raise TranslationErrors(errors)
+
+        cached = fragments, macros, self.includes_key(workdir, filename, fragments)
+        self._encoded[(filename, digest)] = cached
+
+        return cached
+
+    def layout(self, workdir, filename, fragments=None, errors=None, including=()):
+        """ Inline fragments of included files in program order
+
+        Files which fail to encode are skipped, errors of all files are
+        raised together at the end.
+
+        :param including: files which include this one, outermost first
+        """
+        if fragments is None:
+            fragments = []
+
+        top = errors is None
+        if top:
+            errors = []
+
+        try:
+            encoded = self.encode_file(workdir, filename)
+        except TranslationError as ex:
+            add_errors(errors, ex)
+            encoded = []
+
+        including = including + (filename,)
+        for fragment in encoded:
+            if fragment.cmd == '__INCLUDE' and fragment.symbol in including:
+                chain = including + (fragment.symbol,)
+                add_errors(errors, self.recursive_include(fragment.filename, fragment.line_num, fragment.line, chain))
+            elif fragment.cmd == '__INCLUDE':
+                self.layout(workdir, fragment.symbol, fragments, errors, including)
+            else:
+                fragments.append(fragment)
+
+        if top and errors:
+            raise TranslationErrors(errors)
+
+        return fragments
+
+    def assign_addresses(self, fragments, dat_labels_out=None, short=()):
+        """ Label addresses relative to the first fragment
+
+        :param short: ids of fragments encoded with short literal
+        """
+        labels_addr = {}
 
         label_pc = 0
         prev_cmd = ''
         prev_label = ''
-        for resolver_filename, line_num, line, cmd, param1, param2 in self.gen_lines(workdir, filename):
-            try:
-                # pseudo command for symbol names translation
-                if cmd == '__LABEL':
-                    labels_addr[param1] = label_pc
-                    if dat_labels_out is not None:
-                        prev_label = param1
-                        prev_cmd = cmd
+        for fragment in fragments:
+            if fragment.cmd == '__LABEL':
+                labels_addr[fragment.symbol] = label_pc
+                prev_label = fragment.symbol
+                prev_cmd = fragment.cmd
+                continue
+
+            if fragment.cmd == '__EQU':
+                continue
+
+            if fragment.cmd == 'DAT':
+                # store DAT labels
+                if prev_cmd == '__LABEL' and dat_labels_out is not None:
+                    dat_labels_out.append(prev_label)
+            else:
+                prev_cmd = fragment.cmd
+
+            label_pc += fragment.size(id(fragment) in short)
+
+        return labels_addr
+
+    def relax(self, fragments, make_symbols):
+        """ Choose short literal form for `a` operands which fit, see `Fragment.relax`
+
+        Shrinking instructions moves labels, so addresses are re-laid until
+        nothing changes. Instruction which stops fitting after that is kept
+        long for good, which guarantees termination.
+
+        :param make_symbols: label addresses -> symbol table
+        :return: ids of fragments in short form
+        """
+        relaxable = [fragment for fragment in fragments if fragment.relax is not None]
+        short = set()
+        pinned = set()
+
+        while relaxable:
+            symbols = make_symbols(self.assign_addresses(fragments, short=short))
+
+            changed = False
+            for fragment in relaxable:
+                key = id(fragment)
+                if key in pinned:
                     continue
 
-                if cmd == 'DAT':
-                    # store DAT labels
-                    if prev_cmd == '__LABEL' and dat_labels_out is not None:
-                        dat_labels_out.append(prev_label)
+                value = dict(fragment.fixups)[fragment.relax].substitute(symbols)
+                fits = value.is_constant and short_literal(value.const) is not None
+
+                if key in short and not fits:
+                    short.remove(key)
+                    pinned.add(key)
+                    changed = True
+                elif key not in short and fits:
+                    short.add(key)
+                    changed = True
+
+            if not changed:
+                break
+
+        return short
+
+    def resolve_constants(self, fragments, symbols):
+        """ Substitute constants defined across all files.
+
+        :param symbols: known values: name -> int or Value, updated in place
+        :return: symbols
+        """
+        definitions = {fragment.symbol: fragment for fragment in fragments if fragment.cmd == '__EQU'}
+        resolving = set()
+
+        def resolve(name):
+            fragment = definitions[name]
+            if name in resolving:
+                raise self.error(fragment.filename, fragment.line_num, fragment.line, f'Recursive constant: {name}')
+
+            resolving.add(name)
+            for symbol in fragment.value.terms:
+                if symbol not in symbols and symbol in definitions:
+                    resolve(symbol)
 
-                    instructions = []
+            value = fragment.value.substitute(symbols)
+            symbols[name] = value.const if value.is_constant else value
 
-                    params = [param1, param2]
-                    if isinstance(param1, list):
-                        params = param1
+        for name in definitions:
+            if name not in symbols:
+                resolve(name)
 
-                    for param in params:
-                        data_type = OperandType.determine(param, labels={})
+        return symbols
 
-                        if data_type is OperandType.DECIMAL:
-                            instructions.append(int(param))
-                        elif data_type is OperandType.HEX:
-                            instructions.append(int(param, 16))
-                        elif data_type is OperandType.STRING:
-                            for c in param[1:-1]:
-                                instructions.append(ord(c))
+    def check_labels(self, fragments, warnings_out):
+        """ Warn about labels defined more than once, the last definition wins """
+        seen = set()
+        for fragment in fragments:
+            if fragment.cmd != '__LABEL':
+                continue
 
-                    if instructions:
-                        program.append((resolver_filename, line_num, line, instructions))
+            if fragment.symbol in seen:
+                warnings_out.append(self.error(
+                    fragment.filename, fragment.line_num, fragment.line, f'Label {fragment.symbol} redefined',
+                ))
+            seen.add(fragment.symbol)
 
-                    label_pc += len(instructions)
+    def link(self, fragments, dat_labels_out=None, warnings_out=None):
+        """ Assign label addresses and patch symbol references
 
+        :param warnings_out: list for `TranslationError`s which do not stop the build
+        """
+        if warnings_out is not None:
+            self.check_labels(fragments, warnings_out)
+
+        short = self.relax(fragments, lambda labels: self.resolve_constants(fragments, dict(labels)))
+        labels_addr = self.assign_addresses(fragments, dat_labels_out, short)
+        symbols = self.resolve_constants(fragments, dict(labels_addr))
+
+        errors = []
+        program = []
+        for fragment in fragments:
+            if not fragment.words:
+                continue
+
+            instructions = fragment.words
+            if fragment.fixups:
+                try:
+                    instructions = fragment.encode(symbols, id(fragment) in short)
+                except Exception as ex:
+                    add_errors(errors, self.error(fragment.filename, fragment.line_num, fragment.line, ex))
                     continue
 
-                is_basic_op = True
-                code = MNEMONIC_TO_CODE.get(cmd)
-                if not code:
-                    code = SPECIAL_MNEMONICS_TO_CODE.get(cmd) << 5
-                    is_basic_op = False
+            program.append((fragment.filename, fragment.line_num, fragment.line, instructions))
+
+        if errors:
+            raise TranslationErrors(errors)
+
+        return labels_addr, program
+
+    def assemble_object(self, workdir, filename) -> ObjectModule:
+        """ Assemble file (includes are inlined) into relocatable object.
+
+        All labels and constants are exported, references to symbols which
+        are not defined in the file are imported. Every relocated value
+        must be `symbol + constant`, where symbol is a label or import.
+        Relocated literals always take the next word form.
+        """
+        fragments = self.layout(workdir, filename)
+
+        def make_symbols(labels):
+            # local labels are relative to the object base address
+            symbols = {label: Value(pc, {BASE_SYMBOL: 1}) for label, pc in labels.items()}
+            return self.resolve_constants(fragments, symbols)
+
+        short = self.relax(fragments, make_symbols)
+        symbols = make_symbols(self.assign_addresses(fragments, short=short))
+
+        obj = ObjectModule()
+        imports = {}
+        files = {}
+
+        for name, value in symbols.items():
+            value = Value.of(value)
+            if value.is_constant:
+                obj.constants[name] = value.const & 0xffff
+            elif value.terms == {BASE_SYMBOL: 1}:
+                obj.exports[name] = value.const & 0xffff
 
-                param1coded, nw1 = self.operand2bin(param1, relocations_info)
-                param2coded, nw2 = self.operand2bin(param2, relocations_info)
+        for fragment in fragments:
+            if not fragment.words:
+                continue
 
-                if is_basic_op:
-                    code = code | param1coded << 5 | param2coded << 10
+            pc = len(obj.code)
+
+            file_index = files.setdefault(fragment.filename, len(files))
+            obj.lines.append((pc, file_index, fragment.line_num))
+
+            if id(fragment) in short:
+                obj.code.extend(fragment.encode(symbols, short=True))
+                continue
+
+            obj.code.extend(fragment.words)
+            for index, value in fragment.fixups:
+                value = value.substitute(symbols)
+
+                if value.terms == {BASE_SYMBOL: 1}:
+                    symbol = ObjectModule.BASE
+                elif len(value.terms) == 1 and BASE_SYMBOL not in value.terms and 1 in value.terms.values():
+                    symbol = imports.setdefault(next(iter(value.terms)), len(imports))
+                elif value.is_constant:
+                    symbol = None
                 else:
-                    code = code | param1coded << 10
+                    raise self.error(
+                        fragment.filename, fragment.line_num, fragment.line,
+                        'Expression can not be relocated',
+                    )
 
-                instructions = [code]
+                obj.code[pc + index] = value.const & 0xffff
+                if symbol is not None:
+                    obj.relocations.append((pc + index, symbol))
 
-                if nw2 is not None:
-                    instructions.append(nw2)
+        obj.imports = list(imports)
+        obj.files = list(files)
 
-                if nw1 is not None:
-                    instructions.append(nw1)
+        return obj
 
-                program.append((resolver_filename, line_num, line, instructions))
+    def asm2bin(self, workdir, filename):
+        _, program = self.translate(workdir, filename)
 
-                label_pc += len(instructions)
+        return program
 
-                prev_cmd = cmd
-            except Exception as ex:
-                raise TranslationError(
-                    resolver_filename,
-                    line_num,
-                    f'FILE: {resolver_filename}    LINE:  {line_num}     {line}    ERROR: {ex}',
-                )
+    def translate(self, workdir, filename, dat_labels_out=None, warnings_out=None):
+        """ :raise TranslationErrors: with every error found, not only the first one """
+        return self.link(self.layout(workdir, filename), dat_labels_out, warnings_out)
 
-        return labels_addr, program
+
+def save_program(program, bin_location):
+    """ Writes `DCPUTranslator.asm2bin` result to .bin and its source map next to it
+
+    :return: SourceMap
+    """
+    with open(bin_location, 'wb') as f:
+        for _, __, line, instructions in program:
+            for code in instructions:
+                f.write(code.to_bytes(2, byteorder='little'))
+
+    source_map = SourceMap.from_program(program)
+    source_map.save(map_location(bin_location))
+
+    return source_map
 
 
 if __name__ == '__main__':
@@ -259,9 +1043,12 @@ if __name__ == '__main__':
     parser.add_argument('filename')
     parser.add_argument('--debug', action='store_true', default=False)
     parser.add_argument('--output', type=str, default=None)
+    parser.add_argument('--object', type=str, default=None, help='write relocatable object instead of .bin')
     args = parser.parse_args()
 
     translator = DCPUTranslator()
+    if args.object:
+        translator.assemble_object('', args.filename).save(args.object)
     if args.debug:
         print('PC     HEX    BIN                ASM')
         pc = 0
@@ -276,9 +1063,5 @@ if __name__ == '__main__':
 
     if args.output:
         print('Translation started')
-        with open(args.output, 'wb') as f:
-            for _, __, line, instructions in translator.asm2bin('', args.filename):
-                for code in instructions:
-                    f.write(code.to_bytes(2, byteorder='little'))
-
+        save_program(translator.asm2bin('', args.filename), args.output)
         print('Translation done')
@@ -0,0 +1,108 @@
+import numpy as np
+
+
+class World:
+    """ Objects in space: positions, headings and what sensors see of them.
+
+    Data lives in parallel NumPy arrays indexed by object number, so
+    moving every object is one array operation. Scans go through a
+    uniform grid index: objects are sorted by cell key, and the key puts
+    the cells of one grid column next to each other, so the cells a scan
+    covers are one `searchsorted` range per column. The index is rebuilt
+    by `build_index` after objects move, see `Fleet.update_world`.
+    """
+
+    # meters, about the typical sensor range
+    CELL_SIZE = 2000.0
+
+    # cell row offset, keeps row keys positive
+    _ROW_BIAS = 1 << 31
+
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+
+        # (n, 2) meters
+        self.positions = np.zeros((0, 2), dtype=np.float64)
+        # radians
+        self.headings = np.zeros(0, dtype=np.float64)
+        self.types = np.zeros(0, dtype=np.uint16)
+        self.ids = np.zeros(0, dtype=np.uint32)
+        # diameter in meters
+        self.sizes = np.zeros(0, dtype=np.uint16)
+
+        self._keys = None
+        self._order = None
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __repr__(self):
+        return f'<World objects: {len(self)} cell: {self.cell_size}>'
+
+    def add(self, type_, id_, size, x, y, heading=0.0) -> int:
+        """ :return: object number """
+        self.positions = np.append(self.positions, [[x, y]], axis=0)
+        self.headings = np.append(self.headings, heading)
+        self.types = np.append(self.types, np.uint16(type_))
+        self.ids = np.append(self.ids, np.uint32(id_))
+        self.sizes = np.append(self.sizes, np.uint16(size))
+        self._keys = None
+        return len(self) - 1
+
+    def _cells(self, positions):
+        return np.floor(positions / self.cell_size).astype(np.int64)
+
+    def _cell_keys(self, columns, rows):
+        return (columns << 32) + (rows + self._ROW_BIAS)
+
+    def build_index(self):
+        cells = self._cells(self.positions)
+        keys = self._cell_keys(cells[:, 0], cells[:, 1])
+        self._order = np.argsort(keys, kind='stable')
+        self._keys = keys[self._order]
+
+    def query(self, x, y, radius) -> np.ndarray:
+        """ Numbers of objects in grid cells touching the square around (x, y) """
+        if self._keys is None:
+            self.build_index()
+
+        (left, bottom), (right, top) = self._cells(np.array([[x - radius, y - radius], [x + radius, y + radius]]))
+        columns = np.arange(left, right + 1, dtype=np.int64)
+
+        starts = np.searchsorted(self._keys, self._cell_keys(columns, bottom), side='left')
+        ends = np.searchsorted(self._keys, self._cell_keys(columns, top), side='right')
+
+        return np.concatenate([self._order[start:end] for start, end in zip(starts, ends)])
+
+    def scan(self, x, y, heading, scan_range, exclude=None) -> list:
+        """ Contacts in range, from close to far, in `Sensor.update_sensor` format
+
+        Distance is scaled so that `scan_range` is 0xffff, direction is
+        relative to `heading`, a full turn is 0x10000.
+
+        :param exclude: object number of the scanning ship
+        """
+        found = self.query(x, y, scan_range)
+        if exclude is not None:
+            found = found[found != exclude]
+
+        offsets = self.positions[found] - (x, y)
+        distances = np.hypot(offsets[:, 0], offsets[:, 1])
+
+        visible = distances <= scan_range
+        found, offsets, distances = found[visible], offsets[visible], distances[visible]
+
+        order = np.argsort(distances, kind='stable')
+        found, offsets, distances = found[order], offsets[order], distances[order]
+
+        directions = (np.arctan2(offsets[:, 1], offsets[:, 0]) - heading) % (2 * np.pi)
+        angles = (directions * (0x10000 / (2 * np.pi))).astype(np.int64) & 0xffff
+        ranges = (distances * (0xffff / scan_range)).astype(np.int64)
+
+        return [
+            {'type': type_, 'id': id_, 'size': size, 'range': range_, 'angle': angle}
+            for type_, id_, size, range_, angle in zip(
+                self.types[found].tolist(), self.ids[found].tolist(), self.sizes[found].tolist(),
+                ranges.tolist(), angles.tolist(),
+            )
+        ]